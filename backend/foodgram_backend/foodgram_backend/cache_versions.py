@@ -0,0 +1,52 @@
+"""
+Версии наборов данных для построения ключей кеша.
+
+Версия — метка времени последнего изменения набора данных. Ключи кеша,
+зависящие от данных, включают их версии, поэтому для инвалидации
+достаточно сменить версию: старые записи просто перестают читаться
+и истекают по таймауту.
+"""
+import time
+
+from django.core.cache import cache
+
+RECIPES = 'recipes'
+RECIPE_FRAGMENTS = 'recipe_fragments'
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+AUTHORS = 'authors'
+SHOPPING_LISTS = 'shopping_lists'
+
+
+def user_state(user_id):
+    """Версия избранного, списка покупок и подписок пользователя."""
+    return f'user_state:{user_id}'
+
+
+def user_shopping_list(user_id):
+    """Версия сохранённого списка покупок пользователя."""
+    return f'shopping_list:{user_id}'
+
+
+def _key(name):
+    return f'version:{name}'
+
+
+def get_versions(*names):
+    keys = [_key(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, timeout=None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+def get_version(name):
+    return get_versions(name)[0]
+
+
+def bump_version(*names):
+    version = time.time_ns()
+    cache.set_many({_key(name): version for name in names}, timeout=None)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+# Кеши, данные которых видны только одному процессу.
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версии данных, по которым сбрасываются кеши и строятся ETag, меняют
+    воркеры и management-команды, поэтому кеш должен быть общим.
+    """
+    if settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS:
+        return [Error(
+            'Кеш по умолчанию виден только одному процессу: изменения '
+            'версий данных из других воркеров и management-команд '
+            'не дойдут до сервера.',
+            hint='Укажите REDIS_URL или общий CACHE_BACKEND.',
+            id='foodgram.E001')]
+    return []
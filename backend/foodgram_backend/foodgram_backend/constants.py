@@ -11,3 +11,21 @@ MIN_TIME: int = 1
 MAX_TIME: int = 1000
 MIN_INGREDIENT_AMOUNT: int = 1
 MAX_INGREDIENT_AMOUNT: int = 10000
+COUNT_CACHE_TIMEOUT: int = 60
+COUNT_ESTIMATE_THRESHOLD: int = 100000
+RECIPE_FRAGMENT_CACHE_TIMEOUT: int = 60 * 60 * 24
+SHOPPING_LIST_CACHE_TIMEOUT: int = 60 * 60
+CATALOG_CACHE_TIMEOUT: int = 60 * 60
+INGREDIENT_FUZZY_MIN_LENGTH: int = 3
+INGREDIENT_FUZZY_THRESHOLD: float = 0.5
+MAX_IMAGE_SIZE: int = 10 * 1024 * 1024
+RECIPE_IMAGE_VARIANTS: dict = {'small': 320, 'medium': 640}
+AVATAR_VARIANTS: dict = {'small': 64, 'medium': 192}
+MEDIA_FILE_NAME_MAX_LENGTH: int = 255
+MEDIA_GC_GRACE_PERIOD: int = 60 * 60
+IMAGE_VARIANTS_POLL_INTERVAL: int = 5
+FEED_PULL_MIN_RECIPES: int = 500
+POPULARITY_WINDOW_DAYS: int = 7
+POPULARITY_HALF_LIFE_HOURS: int = 48
+POPULARITY_FAVORITE_WEIGHT: float = 1.0
+POPULARITY_SHOPPING_CART_WEIGHT: float = 0.5
@@ -0,0 +1,142 @@
+import base64
+import binascii
+import io
+import itertools
+import re
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from foodgram_backend.constants import MAX_IMAGE_SIZE
+from rest_framework import serializers
+
+DATA_URI_PATTERN = re.compile(r'data:image/([\w.+-]+);base64,')
+DECODE_CHUNK_SIZE = 64 * 1024
+# Пробельные символы, которыми base64 переносят по строкам (MIME, PEM).
+WHITESPACE = ' \t\r\n\v\f'
+WHITESPACE_TABLE = str.maketrans('', '', WHITESPACE)
+IMAGE_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+
+def get_image_extension(header):
+    """Расширение файла по первым байтам изображения или None."""
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    return None
+
+
+def iter_base64_chunks(data, start):
+    """
+    Блоки base64 из `data[start:]` без пробельных символов. Длина всех
+    блоков, кроме последнего, кратна 4, поэтому они декодируются
+    независимо.
+    """
+    rest = ''
+    for offset in range(start, len(data), DECODE_CHUNK_SIZE):
+        chunk = rest + data[
+            offset:offset + DECODE_CHUNK_SIZE].translate(WHITESPACE_TABLE)
+        cut = len(chunk) - len(chunk) % 4
+        chunk, rest = chunk[:cut], chunk[cut:]
+        if chunk:
+            yield chunk
+    if rest:
+        yield rest
+
+
+def close_quietly(file):
+    try:
+        file.close()
+    except FileNotFoundError:
+        pass
+
+
+class Base64ImageField(serializers.ImageField):
+    """
+    Изображение из data URI (`data:image/...;base64,...`) или из
+    multipart-загрузки.
+
+    Base64 декодируется блоками во временный файл (в памяти до
+    FILE_UPLOAD_MAX_MEMORY_SIZE, дальше на диске), поэтому полная копия
+    декодированных данных в памяти не создаётся. Размер и сигнатура
+    формата проверяются до декодирования всего содержимого. Пробельные
+    символы (например, переносы строк MIME) пропускаются.
+    """
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные изображения в base64.',
+        'image_too_large': (
+            'Размер изображения не должен превышать {max_size} МБ.'),
+        'unknown_format': 'Неподдерживаемый формат изображения.',
+    }
+
+    def __init__(self, *args, max_size=MAX_IMAGE_SIZE, **kwargs):
+        self.max_size = max_size
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('data:image'):
+            data = self.decode(data)
+        elif getattr(data, 'size', 0) > self.max_size:
+            self.fail_too_large()
+        return super().to_internal_value(data)
+
+    def fail_too_large(self):
+        self.fail('image_too_large', max_size=self.max_size // (1024 * 1024))
+
+    def decode(self, data):
+        match = DATA_URI_PATTERN.match(data)
+        if match is None:
+            self.fail('invalid_base64')
+        start = match.end()
+        # Пробельные символы декодер пропускает, поэтому они не учитываются.
+        encoded_size = len(data) - start - sum(
+            data.count(char, start) for char in WHITESPACE)
+        if encoded_size // 4 * 3 > self.max_size + 2:
+            self.fail_too_large()
+
+        chunks = iter_base64_chunks(data, start)
+        first_chunk = next(chunks, '')
+        try:
+            header = base64.b64decode(first_chunk[:16], validate=True)
+        except binascii.Error:
+            self.fail('invalid_base64')
+        extension = get_image_extension(header)
+        if extension is None:
+            self.fail('unknown_format')
+
+        name = f'{uuid.uuid4()}.{extension}'
+        content_type = f'image/{match.group(1)}'
+        if encoded_size // 4 * 3 > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+            upload = TemporaryUploadedFile(name, content_type, 0, None)
+            # Хранилище перемещает временный файл при сохранении, поэтому
+            # при удалении объекта его закрываем без попытки удаления.
+            weakref.finalize(upload, close_quietly, upload.file)
+        else:
+            upload = InMemoryUploadedFile(
+                io.BytesIO(), None, name, content_type, 0, None)
+
+        size = 0
+        try:
+            for chunk in itertools.chain((first_chunk,), chunks):
+                chunk = base64.b64decode(chunk, validate=True)
+                size += len(chunk)
+                if size > self.max_size:
+                    upload.close()
+                    self.fail_too_large()
+                upload.file.write(chunk)
+        except binascii.Error:
+            upload.close()
+            self.fail('invalid_base64')
+        upload.file.seek(0)
+        upload.size = size
+        return upload
@@ -0,0 +1,194 @@
+"""
+Уменьшенные копии и WebP-варианты загруженных изображений.
+
+Варианты строит отдельный процесс (`manage.py build_image_variants`),
+а не воркер веб-сервера. Очередь хранится в самих объектах: варианты
+записываются в JSON-поле модели вместе с именем исходного файла, и
+объекты, у которых оно не совпадает с текущим изображением, ждут
+построения. Пока варианты не готовы, вместо них отдаётся оригинал.
+"""
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.fields.json import KeyTextTransform
+from PIL import Image, ImageOps
+
+VARIANTS_DIR = 'variants'
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+# Форматы, в которых сохраняются уменьшенные копии; остальные — в PNG.
+KEEP_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+# Версия структуры вариантов; варианты другой версии не отдаются.
+VARIANTS_FORMAT = 2
+
+
+def get_variant_name(name, label, extension):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(
+        directory, VARIANTS_DIR, f'{stem}_{label}.{extension}')
+
+
+def save_variant(image, name, image_format, **options):
+    # Хранилище называет файлы по содержимому: одинаковые варианты
+    # разных загрузок сохраняются один раз.
+    buffer = ContentFile(b'')
+    image.save(buffer, image_format, **options)
+    buffer.seek(0)
+    return default_storage.save(name, buffer)
+
+
+def render_variants(name, sizes):
+    """
+    Строит варианты изображения `name` для размеров `sizes`
+    ({метка: наибольшая сторона в пикселях}). Размеры, не меньшие
+    исходного изображения, пропускаются: такой вариант не меньше
+    оригинала. Выполняется в процессе пула и не обращается к БД.
+    """
+    with default_storage.open(name) as file:
+        with Image.open(file) as source:
+            source_format = source.format
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    extension = KEEP_FORMATS.get(source_format, 'png')
+    image_format = 'JPEG' if extension == 'jpg' else extension.upper()
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    variants = {}
+    for label, size in sizes.items():
+        if max(image.size) <= size:
+            continue
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+        path = save_variant(
+            resized, get_variant_name(name, label, extension),
+            image_format, quality=JPEG_QUALITY, optimize=True)
+        variants[label] = {
+            'width': resized.width,
+            'url': path,
+            'webp': path if extension == 'webp' else save_variant(
+                resized, get_variant_name(name, f'{label}_webp', 'webp'),
+                'WEBP', quality=WEBP_QUALITY),
+        }
+    return {'format': VARIANTS_FORMAT, 'source': name, 'sizes': variants}
+
+
+def store_variants(model, pk, field_name, variants_field, variants):
+    """
+    Сохраняет варианты, если у объекта всё ещё то же изображение.
+    Сохранение через `save()` вызывает обычные сигналы модели, которые
+    сбрасывают связанные кеши.
+    """
+    instance = model._default_manager.filter(
+        pk=pk, **{field_name: variants['source']}).first()
+    if instance is None:
+        return
+    setattr(instance, variants_field, variants)
+    update_fields = [variants_field] + [
+        field.name for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)]
+    instance.save(update_fields=update_fields)
+
+
+def is_current(variants, name):
+    """Построены ли `variants` текущего формата для изображения `name`."""
+    variants = variants or {}
+    return (variants.get('format') == VARIANTS_FORMAT
+            and variants.get('source') == name)
+
+
+def get_pending(model, field_name, variants_field):
+    """Объекты с изображением, для которого нет вариантов текущего формата."""
+    return model._default_manager.exclude(
+        Q(**{f'{field_name}__isnull': True}) | Q(**{field_name: ''})
+    ).alias(
+        variants_source=KeyTextTransform('source', variants_field)
+    ).filter(
+        Q(variants_source__isnull=True)
+        | ~Q(variants_source=F(field_name))
+        | Q(**{f'{variants_field}__format__isnull': True})
+        | ~Q(**{f'{variants_field}__format': VARIANTS_FORMAT}))
+
+
+def build_variants(model, pk, name, field_name, variants_field, sizes):
+    """
+    Строит и сохраняет варианты изображения `name` объекта `pk`.
+    Если изображение не удалось обработать, сохраняется отметка об
+    ошибке, чтобы не повторять попытку: отдаётся оригинал. Возвращает
+    сохранённые варианты.
+    """
+    try:
+        variants = render_variants(name, sizes)
+    except Exception:
+        variants = {
+            'format': VARIANTS_FORMAT, 'source': name, 'sizes': {},
+            'failed': True}
+    store_variants(model, pk, field_name, variants_field, variants)
+    return variants
+
+
+def schedule_variants(instance, field_name, variants_field, sizes):
+    """
+    При IMAGE_VARIANTS_INLINE строит варианты в текущем процессе после
+    фиксации транзакции, если изображение объекта изменилось. Иначе
+    объект находит `build_image_variants` через `get_pending`.
+    """
+    field_file = getattr(instance, field_name)
+    if (not settings.IMAGE_VARIANTS_INLINE or not field_file
+            or is_current(getattr(instance, variants_field),
+                          field_file.name)):
+        return
+
+    def build():
+        # Объект ещё используется в запросе, например для ответа.
+        setattr(instance, variants_field, build_variants(
+            type(instance), instance.pk, field_file.name, field_name,
+            variants_field, sizes))
+
+    transaction.on_commit(build)
+
+
+def get_variant_urls(field_file, variants, sizes):
+    """
+    Ссылки на варианты изображения: {метка: {'width', 'url', 'webp'}},
+    `width` — ширина варианта в пикселях. Варианты, которые не меньше
+    оригинала, не строятся и не отдаются. Пока варианты не построены,
+    вместо них отдаётся оригинал с неизвестной шириной (None).
+    """
+    if not field_file:
+        return None
+    original = field_file.url
+    if (not is_current(variants, field_file.name)
+            or variants.get('failed')):
+        return {
+            label: {'width': None, 'url': original, 'webp': original}
+            for label in sizes
+        }
+    storage = field_file.storage
+    return {
+        label: {
+            'width': paths['width'],
+            'url': storage.url(paths['url']),
+            'webp': storage.url(paths['webp']),
+        }
+        for label, paths in variants['sizes'].items()
+        if label in sizes
+    }
+
+
+def build_absolute_variant_urls(urls, build_url):
+    """Применяет `build_url` к ссылкам из `get_variant_urls`."""
+    if urls is None:
+        return None
+    return {
+        label: {
+            'width': variant['width'],
+            'url': build_url(variant['url']),
+            'webp': build_url(variant['webp']),
+        }
+        for label, variant in urls.items()
+    }
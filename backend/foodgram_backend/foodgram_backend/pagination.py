@@ -1,19 +1,258 @@
-from foodgram_backend.constants import MAX_PAGE_SIZE, PAGE_SIZE
+import base64
+import hashlib
+import heapq
+import json
+from functools import cached_property, partial
+from itertools import islice
+from urllib import parse
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from foodgram_backend.cache_versions import get_versions, user_state
+from foodgram_backend.constants import (COUNT_CACHE_TIMEOUT,
+                                        COUNT_ESTIMATE_THRESHOLD,
+                                        MAX_PAGE_SIZE, PAGE_SIZE)
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк по плану запроса PostgreSQL. Для небольших таблиц
+    и других СУБД возвращает точное значение.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+        if row is None or row[0] < COUNT_ESTIMATE_THRESHOLD:
+            return queryset.count()
+        sql, params = queryset.order_by().values('pk').query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CountedPaginator(DjangoPaginator):
+    """Пагинатор Django с заранее посчитанным числом объектов."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        return self._count
 
 
 class CustomPagination(PageNumberPagination):
     """
-    Кастомная пагинация с поддержкой `limit` и `page`
+    Кастомная пагинация с поддержкой `limit` и `page`.
+
+    Если в запросе передан параметр `cursor` (в том числе пустой — для
+    первой страницы), а представление задаёт `cursor_fields`, используется
+    keyset-пагинация: страница выбирается условием по полям курсора вместо
+    OFFSET, поэтому время ответа не зависит от глубины страницы.
+
+    Если представление задаёт `get_count_versions()`, общее число объектов
+    кешируется по набору фильтров и версиям данных, от которых оно зависит.
+    В режиме курсора число не считается: `count` равен null.
     """
     page_size_query_param = 'limit'
     page_size = PAGE_SIZE
     max_page_size = MAX_PAGE_SIZE
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_fields = getattr(view, 'cursor_fields', None)
+        self.cursor_mode = bool(
+            self.cursor_fields
+            and self.cursor_query_param in request.query_params)
+        if not self.cursor_mode:
+            self.count = self.get_queryset_count(queryset, request, view)
+            self.django_paginator_class = partial(
+                CountedPaginator, count=self.count)
+            return super().paginate_queryset(queryset, request, view)
+
+        # Страницы по курсору не считают общее число объектов.
+        self.count = None
+        return self.paginate_cursor([queryset], request)
+
+    def paginate_sources(self, querysets, request, view=None):
+        """
+        Keyset-пагинация по объединению выборок с общими полями курсора
+        `cursor_fields` представления. Курсор используется всегда,
+        общее число объектов не считается.
+        """
+        self.cursor_fields = view.cursor_fields
+        self.cursor_mode = True
+        self.count = None
+        return self.paginate_cursor(querysets, request)
+
+    def paginate_cursor(self, querysets, request):
+        """
+        Страница по курсору: из каждой выборки берётся не больше страницы
+        и одного объекта, результаты сливаются по полям курсора.
+        """
+        self.request = request
+        self.cursor_page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request, querysets[0])
+
+        ordering = [f'-{field}' for field in self.cursor_fields]
+        if reverse:
+            ordering = list(self.cursor_fields)
+        parts = []
+        for queryset in querysets:
+            queryset = queryset.order_by(*ordering)
+            if position is not None:
+                queryset = queryset.filter(
+                    self.get_seek_filter(position, reverse))
+            parts.append(queryset[:self.cursor_page_size + 1])
+        results = list(islice(
+            heapq.merge(*parts, key=self.get_position, reverse=not reverse),
+            self.cursor_page_size + 1))
+        has_more = len(results) > self.cursor_page_size
+        results = results[:self.cursor_page_size]
+        if reverse:
+            results.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        self.cursor_results = results
+        return results
+
+    def get_position(self, instance):
+        return tuple(getattr(instance, field) for field in self.cursor_fields)
+
+    def get_count_cache_key(self, request, view):
+        get_count_versions = getattr(view, 'get_count_versions', None)
+        if get_count_versions is None:
+            return None
+        ignored = (self.page_query_param, self.page_size_query_param,
+                   self.cursor_query_param)
+        params = sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+            if key not in ignored)
+        names = list(get_count_versions())
+        user = request.user
+        # Число, зависящее от состояния пользователя (избранное, корзина,
+        # подписки), кешируется отдельно для каждого пользователя.
+        user_id = (
+            user.id if user.is_authenticated and user_state(user.id) in names
+            else None)
+        # Состояние из БД, которое меняют другие процессы.
+        get_count_state = getattr(view, 'get_count_state', list)
+        digest = hashlib.md5(
+            json.dumps([
+                request.path, params, user_id, names, get_versions(*names),
+                get_count_state(),
+            ], default=str).encode(),
+            usedforsecurity=False).hexdigest()
+        return f'paginator_count:{digest}'
+
+    def get_queryset_count(self, queryset, request, view):
+        key = self.get_count_cache_key(request, view)
+        if key is None:
+            return queryset.count()
+        count = cache.get(key)
+        if count is None:
+            count = estimate_count(queryset)
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_seek_filter(self, position, reverse):
+        """
+        Строит условие `(f1, f2, ...) < (v1, v2, ...)` (или `>` при
+        обратном направлении) в виде, понятном ORM.
+        """
+        lookup = 'gt' if reverse else 'lt'
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.cursor_fields, position):
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def get_cursor_field(self, queryset, name):
+        """Поле модели или аннотации, по которому строится курсор."""
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        field = queryset.model._meta.get_field(name)
+        # Значение внешнего ключа проверяется как значение ключа, без
+        # запроса существования связанного объекта.
+        return field.target_field if field.is_relation else field
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            padding = '=' * (-len(encoded) % 4)
+            querystring = base64.urlsafe_b64decode(
+                encoded + padding).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            position = json.loads(tokens['p'][0])
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.cursor_fields)
+                or not all(isinstance(value, str) for value in position)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.get_cursor_field(queryset, name).clean(value, None)
+                for name, value in zip(self.cursor_fields, position)]
+        except ValidationError:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, instance, reverse):
+        position = [
+            str(getattr(instance, field)) for field in self.cursor_fields]
+        tokens = {'p': json.dumps(position)}
+        if reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens, doseq=True)
+        encoded = base64.urlsafe_b64encode(
+            querystring.encode('ascii')).decode('ascii').rstrip('=')
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.cursor_results:
+            return None
+        return self.encode_cursor(self.cursor_results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.cursor_results:
+            return None
+        return self.encode_cursor(self.cursor_results[0], reverse=True)
 
     def get_paginated_response(self, data):
         return Response({
-            'count': self.page.paginator.count,
+            'count': self.count,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
@@ -73,6 +73,15 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'foodgram_backend.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'foodgram_backend.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 DJOSER = {
@@ -136,6 +145,30 @@ DATABASES = {
     }
 }
 
+# Версии данных (foodgram_backend.cache_versions) хранятся в кеше и должны
+# быть общими для всех воркеров и management-команд, поэтому в развёртывании
+# нужен Redis (REDIS_URL). LocMemCache подходит только для разработки
+# и тестов в одном процессе: `check --deploy` с ним завершается ошибкой.
+REDIS_URL = os.getenv('REDIS_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.redis.RedisCache' if REDIS_URL
+            else 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', REDIS_URL),
+    }
+}
+
+# Каталог файлов префиксного индекса ингредиентов, общий для воркеров.
+INGREDIENT_INDEX_DIR = os.getenv('INGREDIENT_INDEX_DIR', '')
+# Наибольшее число ингредиентов в ответе на поиск по названию.
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 100))
+# Строить варианты изображений сразу в процессе, сохранившем
+# изображение (для разработки). Иначе их строит отдельный процесс
+# `manage.py build_image_variants --loop`.
+IMAGE_VARIANTS_INLINE = os.getenv('IMAGE_VARIANTS_INLINE', '') == 'True'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -179,6 +212,21 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Загруженные файлы хранятся под именами по хешу содержимого
+STORAGES = {
+    'default': {
+        'BACKEND': 'foodgram_backend.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# TTF-шрифт с кириллицей для выгрузки списка покупок в PDF
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
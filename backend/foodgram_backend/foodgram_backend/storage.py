@@ -0,0 +1,34 @@
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла — SHA-256 его содержимого:
+    `<каталог>/<первые 2 символа хеша>/<хеш>.<расширение>`.
+
+    Одинаковые файлы хранятся один раз: если файл с таким содержимым уже
+    есть, он не перезаписывается, а только получает новое время
+    изменения, чтобы его не удалила очистка неиспользуемых файлов.
+    Учёт ссылок на файлы ведётся в `recipes.media`.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(
+            os.path.dirname(name), digest[:2], f'{digest}{extension}')
+
+    def _save(self, name, content):
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super()._save(name, content)
@@ -1,9 +1,9 @@
 from django import forms
 from django.contrib import admin
 from django.core.exceptions import ValidationError
-from django.db.models import Count
 from foodgram_backend.constants import MAX_TIME, MIN_TIME
 
+from . import shopping_list
 from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                      ShoppingCart, ShortLink, Tag)
 
@@ -91,21 +91,21 @@ class RecipeAdmin(admin.ModelAdmin):
     form = RecipeAdminForm
 
     list_display = ('name', 'author', 'cooking_time',
-                    'favorites_count', 'created')
+                    'favorites_count', 'in_carts_count', 'created')
     list_filter = ('tags', 'author', 'created')
     search_fields = ('name', 'author__username', 'author__email')
     filter_horizontal = ('tags',)
     inlines = [IngredientInRecipeInline]
-    readonly_fields = ('created',)
-
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            _favorites_count=Count('favorited_by', distinct=True)
-        )
-
-    @admin.display(description='В избранном (раз)')
-    def favorites_count(self, obj):
-        return obj._favorites_count or 0
+    readonly_fields = ('created', 'favorites_count', 'in_carts_count')
+    list_select_related = ('author',)
+
+    def save_related(self, request, form, formsets, change):
+        old_amounts = shopping_list.get_recipe_amounts(form.instance.pk)
+        super().save_related(request, form, formsets, change)
+        if change:
+            shopping_list.update_recipe(
+                form.instance.pk, old_amounts,
+                shopping_list.get_recipe_amounts(form.instance.pk))
 
     def save_formset(self, request, form, formset, change):
         if formset.model == IngredientInRecipe:
@@ -0,0 +1,291 @@
+"""
+Микробенчмарки быстрых путей API.
+
+Запускаются командой `benchmark` на данных текущей базы, например после
+`generate_data`. Каждый сценарий возвращает строки (что измерено, время
+одного вызова в миллисекундах) — лучшее из `repeat` повторов.
+"""
+import base64
+import csv
+import io
+import os
+import tempfile
+import timeit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models import Sum
+from foodgram_backend.constants import BATCH_SIZE
+from foodgram_backend.parsers import FastJSONParser
+from foodgram_backend.renderers import FastJSONRenderer
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from . import ingredient_index
+from .cache import invalidate_recipe_fragments
+from .ingredient_search import TrigramIndex
+from .models import (Ingredient, IngredientInRecipe, Recipe, ShoppingCart,
+                     ShoppingListItem)
+from .serializers import RecipeFragmentSerializer, RecipeListSerializer
+from .shopping_list import rebuild as rebuild_shopping_lists
+from .utils import generate_shopping_list
+
+User = get_user_model()
+
+BENCHMARKS = {}
+# Размер тела запроса с изображением в base64 для сценария `json`.
+RECIPE_BODY_SIZE = 4 * 1024 * 1024
+# Префиксы для сценариев поиска ингредиентов: короткий и длинные.
+INGREDIENT_PREFIXES = ('м', 'мол', 'кар')
+# Запросы ранжированного поиска: заполняемые совпадениями по началу
+# названия и нечёткие (опечатки, совпадения в середине названия).
+INGREDIENT_QUERIES = ('м', 'молоко', 'сыр', 'малоко', 'чеснк', 'сыр твор')
+# Во сколько раз каталог сценария `ingredient_search` больше
+# data/ingredients.csv.
+CATALOG_COPIES = 50
+
+
+def benchmark(name):
+    """Регистрирует сценарий под именем `name`."""
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+def measure(func, repeat, setup=None):
+    """Лучшее время одного вызова `func` в миллисекундах."""
+    return min(timeit.repeat(
+        func, setup=setup or (lambda: None), number=1, repeat=repeat)) * 1000
+
+
+def read_catalog():
+    """Пары (название, единица измерения) из data/ingredients.csv."""
+    path = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+    with open(path, encoding='utf-8') as file:
+        return [(name, unit) for name, unit in csv.reader(file)]
+
+
+def get_request(path):
+    """
+    Анонимный запрос к `path`. Хост берётся из ALLOWED_HOSTS: ссылки на
+    изображения строятся через `build_absolute_uri`, который проверяет хост.
+    """
+    host = next(
+        (host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'),
+        'localhost')
+    request = Request(APIRequestFactory(SERVER_NAME=host).get(path))
+    request.user = AnonymousUser()
+    return request
+
+
+@benchmark('recipe_list')
+def recipe_list(size, repeat):
+    """
+    Сериализация страницы рецептов: поля DRF против сборки из словарей
+    без кеша фрагментов и с прогретым кешем. Время включает запросы.
+    """
+    request = get_request('/api/recipes/')
+    queryset = Recipe.objects.select_related('author').with_user_flags(
+        request.user).order_by('-created', '-id')
+    recipe_ids = list(queryset.values_list('id', flat=True)[:size])
+
+    def fields():
+        recipes = list(queryset.prefetch_related(
+            'tags', 'recipe_ingredients__ingredient')[:size])
+        return RecipeListSerializer(
+            recipes, many=True, context={'request': request}).data
+
+    def fragments():
+        return RecipeFragmentSerializer(
+            list(queryset[:size]), many=True,
+            context={'request': request}).data
+
+    return [
+        (f'{len(recipe_ids)} рецептов, поля DRF', measure(fields, repeat)),
+        ('словари, без кеша фрагментов', measure(
+            fragments, repeat,
+            setup=lambda: invalidate_recipe_fragments(recipe_ids))),
+        ('словари, кеш фрагментов', measure(
+            fragments, repeat, setup=fragments)),
+    ]
+
+
+@benchmark('json')
+def json_codecs(size, repeat):
+    """
+    Рендеринг полного каталога ингредиентов из data/ingredients.csv
+    и разбор тела создания рецепта с изображением в base64 размером
+    RECIPE_BODY_SIZE: стандартные классы DRF против orjson.
+    """
+    catalog = [
+        {'id': index, 'name': name, 'measurement_unit': unit}
+        for index, (name, unit) in enumerate(read_catalog(), 1)]
+    image = base64.b64encode(os.urandom(RECIPE_BODY_SIZE * 3 // 4)).decode()
+    body = JSONRenderer().render({
+        'ingredients': [{'id': 1, 'amount': 10}],
+        'tags': [1],
+        'image': f'data:image/png;base64,{image}',
+        'name': 'Рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+    })
+    rows = []
+    for renderer in (JSONRenderer(), FastJSONRenderer()):
+        rows.append((
+            f'{len(catalog)} ингредиентов, {type(renderer).__name__}',
+            measure(lambda: renderer.render(catalog), repeat)))
+    for parser in (JSONParser(), FastJSONParser()):
+        rows.append((
+            f'тело {len(body) // 1024} КБ, {type(parser).__name__}',
+            measure(lambda: parser.parse(io.BytesIO(body)), repeat)))
+    return rows
+
+
+@benchmark('shopping_list')
+def shopping_list(size, repeat):
+    """
+    Текстовый список покупок отдельного пользователя с `size` последними
+    рецептами в корзине: запрос ингредиентов каждого рецепта, GROUP BY
+    по строкам рецептов корзины и чтение сохранённого списка
+    (ShoppingListItem). Пользователь и корзина создаются в транзакции,
+    которая затем откатывается.
+    """
+    recipe_ids = list(Recipe.objects.order_by('-created', '-id').values_list(
+        'id', flat=True)[:size])
+    if len(recipe_ids) < size:
+        raise CommandError(
+            f'Для корзины из {size} рецептов в базе только '
+            f'{len(recipe_ids)} рецептов: запустите generate_data '
+            f'или уменьшите --size.')
+    with transaction.atomic():
+        user_id = User.objects.create(
+            email='benchmark@example.com', username='benchmark',
+            first_name='Benchmark', last_name='Benchmark').id
+        ShoppingCart.objects.bulk_create(
+            (ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+             for recipe_id in recipe_ids),
+            batch_size=BATCH_SIZE)
+        rebuild_shopping_lists([user_id])
+        rows = measure_shopping_list(user_id, repeat)
+        transaction.set_rollback(True)
+    return rows
+
+
+def measure_shopping_list(user_id, repeat):
+    """Строки сценария `shopping_list` для корзины пользователя."""
+    recipes = ShoppingCart.objects.filter(user_id=user_id).count()
+
+    def per_recipe():
+        totals = {}
+        for cart in ShoppingCart.objects.filter(
+                user_id=user_id).select_related('recipe'):
+            for item in cart.recipe.recipe_ingredients.select_related(
+                    'ingredient'):
+                key = (item.ingredient.name, item.ingredient.measurement_unit)
+                totals[key] = totals.get(key, 0) + item.amount
+        return ''.join(generate_shopping_list(
+            (name, unit, total)
+            for (name, unit), total in sorted(totals.items())))
+
+    def group_by():
+        return ''.join(generate_shopping_list(
+            IngredientInRecipe.objects.filter(
+                recipe__in_shopping_cart__user_id=user_id
+            ).values_list(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).annotate(total=Sum('amount')).order_by(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).iterator()))
+
+    def stored():
+        return ''.join(generate_shopping_list(
+            ShoppingListItem.objects.filter(user_id=user_id).values_list(
+                'ingredient__name', 'ingredient__measurement_unit',
+                'total_amount'
+            ).order_by(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ).iterator()))
+
+    return [
+        (f'корзина из {recipes} рецептов, запрос на рецепт',
+         measure(per_recipe, repeat)),
+        ('GROUP BY по корзине', measure(group_by, repeat)),
+        ('сохранённый список покупок', measure(stored, repeat)),
+    ]
+
+
+@benchmark('ingredient_prefix')
+def ingredient_prefix(size, repeat):
+    """
+    Поиск ингредиентов по началу названия в каталоге текущей базы:
+    mmap-индекс против запроса `name__istartswith` через ORM.
+    """
+    index = ingredient_index.get_index()
+    rows = []
+    for prefix in INGREDIENT_PREFIXES:
+        found = len(index.search(prefix))
+        rows.append((
+            f'«{prefix}» ({found} из {index.count}), индекс',
+            measure(lambda: index.search(prefix), repeat)))
+        rows.append((
+            f'«{prefix}», ORM',
+            measure(lambda: list(Ingredient.objects.filter(
+                name__istartswith=prefix
+            ).values_list('id', 'name', 'measurement_unit')), repeat)))
+    return rows
+
+
+@benchmark('ingredient_search')
+def ingredient_search(size, repeat):
+    """
+    Ранжированный поиск (префикс, затем триграммы) по каталогу из
+    CATALOG_COPIES копий data/ingredients.csv, копии различаются номером
+    в названии. Для сравнения тот же каталог вставляется в БД в
+    транзакции, которая затем откатывается, и ищется `name__icontains`.
+    """
+    catalog = [
+        (f'{name} {copy}' if copy else name, unit)
+        for copy in range(CATALOG_COPIES) for name, unit in read_catalog()]
+    limit = settings.INGREDIENT_SEARCH_LIMIT
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ingredients.idx')
+        ingredient_index.write_index(path, [
+            (ingredient_index.normalize(ingredient_index.clean(name)),
+             ingredient_index.clean(name), pk, ingredient_index.clean(unit))
+            for pk, (name, unit) in enumerate(catalog, 1)])
+        index = ingredient_index.IngredientIndex(path)
+        trigrams = None
+
+        def build():
+            nonlocal trigrams
+            trigrams = TrigramIndex(index)
+
+        rows.append((
+            f'{len(catalog)} ингредиентов, построение триграммного индекса',
+            measure(build, min(repeat, 3))))
+        for query in INGREDIENT_QUERIES:
+            rows.append((
+                f'«{query}», индекс (не больше {limit})',
+                measure(lambda: trigrams.search(query, limit), repeat)))
+
+        with transaction.atomic():
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in catalog),
+                batch_size=BATCH_SIZE, ignore_conflicts=True)
+            for query in INGREDIENT_QUERIES:
+                rows.append((
+                    f'«{query}», name__icontains',
+                    measure(lambda: list(Ingredient.objects.filter(
+                        name__icontains=query
+                    ).values_list('id', 'name', 'measurement_unit')),
+                        repeat)))
+            transaction.set_rollback(True)
+    return rows
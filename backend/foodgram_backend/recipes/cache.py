@@ -0,0 +1,67 @@
+from django.core.cache import cache
+from foodgram_backend.cache_versions import (INGREDIENTS, RECIPE_FRAGMENTS,
+                                             SHOPPING_LISTS, get_version,
+                                             get_versions, user_shopping_list)
+from foodgram_backend.constants import (RECIPE_FRAGMENT_CACHE_TIMEOUT,
+                                        SHOPPING_LIST_CACHE_TIMEOUT)
+
+# Увеличивается при изменении структуры фрагмента, чтобы не читать
+# из кеша фрагменты старого формата.
+FRAGMENT_FORMAT = 3
+
+
+def _fragment_key(version, recipe_id):
+    return f'recipe_fragment:{FRAGMENT_FORMAT}:{version}:{recipe_id}'
+
+
+def get_recipe_fragments(recipes, build):
+    """
+    Возвращает словарь {id рецепта: фрагмент} для переданных рецептов.
+    Отсутствующие в кеше фрагменты строятся функцией `build` одним вызовом
+    и сохраняются в кеш.
+    """
+    version = get_version(RECIPE_FRAGMENTS)
+    keys = {_fragment_key(version, recipe.id): recipe for recipe in recipes}
+    cached = cache.get_many(list(keys))
+    fragments = {
+        keys[key].id: fragment for key, fragment in cached.items()}
+    missing = [recipe for key, recipe in keys.items() if key not in cached]
+    if missing:
+        built = build(missing)
+        cache.set_many(
+            {_fragment_key(version, recipe_id): fragment
+             for recipe_id, fragment in built.items()},
+            RECIPE_FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(built)
+    return fragments
+
+
+def invalidate_recipe_fragments(recipe_ids):
+    version = get_version(RECIPE_FRAGMENTS)
+    cache.delete_many(
+        [_fragment_key(version, recipe_id) for recipe_id in recipe_ids])
+
+
+def get_shopping_list_file_key(user_id, file_format):
+    """
+    Ключ выгрузки списка покупок. Меняется при любом изменении списка
+    покупок пользователя или справочника ингредиентов.
+    """
+    versions = get_versions(
+        user_shopping_list(user_id), SHOPPING_LISTS, INGREDIENTS)
+    return (f'shopping_list_file:{user_id}:{file_format}:'
+            + ':'.join(map(str, versions)))
+
+
+def cache_streamed_content(key, chunks):
+    """
+    Отдаёт части ответа по мере готовности и сохраняет собранный ответ
+    в кеш, если он был отдан полностью.
+    """
+    parts = []
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, b''.join(parts), SHOPPING_LIST_CACHE_TIMEOUT)
@@ -0,0 +1,66 @@
+"""
+Денормализованные счётчики: сколько раз рецепт добавлен в избранное
+и в списки покупок, сколько у пользователя рецептов и подписчиков.
+
+Счётчики меняются атомарным `UPDATE ... SET поле = поле ± 1` при
+создании и удалении связанных объектов (см. `recipes.signals`), поэтому
+спискам и карточкам не нужны агрегирующие запросы. Расхождения после
+массовых операций в обход сигналов исправляет `repair()` (команда
+`repair_counters`).
+"""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from foodgram_backend.constants import BATCH_SIZE
+from users.models import Follow
+
+from .models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+REPAIR_BATCH_SIZE = BATCH_SIZE * 10
+
+# Модель связи: (модель со счётчиком, поле счётчика, внешний ключ связи).
+SOURCES = {
+    Favorite: (Recipe, 'favorites_count', 'recipe_id'),
+    ShoppingCart: (Recipe, 'in_carts_count', 'recipe_id'),
+    Recipe: (User, 'recipes_count', 'author_id'),
+    Follow: (User, 'followers_count', 'author_id'),
+}
+
+
+def change(instance, delta):
+    """Изменяет счётчик, связанный с созданным или удалённым объектом."""
+    model, field, key = SOURCES[type(instance)]
+    model.objects.filter(pk=getattr(instance, key)).update(
+        **{field: F(field) + delta})
+
+
+def get_actual_count(source, key):
+    return Coalesce(Subquery(
+        source.objects.filter(**{key: OuterRef('pk')}).order_by().values(
+            key).annotate(count=Count('pk')).values('count')), 0)
+
+
+def repair(check=False, batch_size=REPAIR_BATCH_SIZE):
+    """
+    Сверяет счётчики с данными диапазонами первичных ключей по
+    `batch_size` строк и исправляет расхождения (если не `check`).
+    Возвращает {поле счётчика: число строк с расхождением}.
+    """
+    drift = {}
+    for source, (model, field, key) in SOURCES.items():
+        drift[field] = 0
+        last_pk = model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        for start in range(0, last_pk + 1, batch_size):
+            drifted = list(model.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size
+            ).annotate(
+                actual=get_actual_count(source, key)
+            ).exclude(**{field: F('actual')}).values_list('pk', flat=True))
+            drift[field] += len(drifted)
+            if drifted and not check:
+                model.objects.filter(pk__in=drifted).update(
+                    **{field: get_actual_count(source, key)})
+    return drift
@@ -0,0 +1,108 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+
+Лента хранится в `FeedEntry` и заполняется при записи: новый рецепт
+раскладывается по лентам подписчиков автора, при подписке в ленту
+добавляются рецепты автора, при отписке — удаляются. Поэтому чтение
+ленты — проход по индексу (пользователь, дата) без соединения подписок
+с рецептами.
+
+Рецепты авторов, у которых не меньше FEED_PULL_MIN_RECIPES рецептов
+(`FeedPullAuthor`), в ленты не копируются: подписка на такого автора
+стоила бы копирования всех его рецептов. Они выбираются из таблицы
+рецептов при запросе ленты и сливаются с сохранённой частью.
+"""
+from itertools import islice
+
+from django.db.models import Count, F
+from foodgram_backend.constants import BATCH_SIZE, FEED_PULL_MIN_RECIPES
+from users.models import Follow
+
+from .models import FeedEntry, FeedPullAuthor, Recipe
+
+
+def is_pull_author(author_id):
+    return FeedPullAuthor.objects.filter(author_id=author_id).exists()
+
+
+def create_entries(entries):
+    """Сохраняет записи ленты пачками, пропуская уже существующие."""
+    entries = iter(entries)
+    for batch in iter(lambda: list(islice(entries, BATCH_SIZE)), []):
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(recipe_id, author_id, created):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    if is_pull_author(author_id):
+        return
+    if Recipe.objects.filter(
+            author_id=author_id).count() >= FEED_PULL_MIN_RECIPES:
+        FeedPullAuthor.objects.get_or_create(author_id=author_id)
+        FeedEntry.objects.filter(author_id=author_id).delete()
+        return
+    follower_ids = Follow.objects.filter(
+        author_id=author_id).values_list('user_id', flat=True)
+    create_entries(
+        FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                  author_id=author_id, created=created)
+        for user_id in follower_ids.iterator(chunk_size=BATCH_SIZE))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя рецепты автора после подписки."""
+    if is_pull_author(author_id):
+        return
+    create_entries(
+        FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                  author_id=author_id, created=created)
+        for recipe_id, created in Recipe.objects.filter(
+            author_id=author_id).values_list('id', 'created').iterator())
+
+
+def prune(user_id, author_id):
+    """Удаляет рецепты автора из ленты пользователя после отписки."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def get_sources(user):
+    """
+    Части ленты пользователя, упорядочиваемые по (`created`,
+    `recipe_id`): сохранённые записи и рецепты авторов, которые
+    читаются при запросе.
+    """
+    pull_author_ids = Follow.objects.filter(
+        user=user, author__feed_pull__isnull=False
+    ).values('author_id')
+    return [
+        FeedEntry.objects.filter(user=user).only('recipe_id', 'created'),
+        Recipe.objects.filter(author_id__in=pull_author_ids).annotate(
+            recipe_id=F('id')).only('id', 'created'),
+    ]
+
+
+def rebuild():
+    """
+    Пересобирает все ленты по подпискам и рецептам. Нужна после
+    массовых вставок, которые не вызывают сигналы.
+    """
+    FeedEntry.objects.all().delete()
+    FeedPullAuthor.objects.all().delete()
+    FeedPullAuthor.objects.bulk_create(
+        FeedPullAuthor(author_id=author_id)
+        for author_id in Recipe.objects.order_by().values(
+            'author_id'
+        ).annotate(count=Count('id')).filter(
+            count__gte=FEED_PULL_MIN_RECIPES
+        ).values_list('author_id', flat=True))
+    entries = Follow.objects.filter(
+        author__feed_pull__isnull=True, author__recipes__isnull=False
+    ).values_list(
+        'user_id', 'author__recipes', 'author_id', 'author__recipes__created'
+    ).order_by()
+    create_entries(
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id,
+                  created=created)
+        for user_id, recipe_id, author_id, created in entries.iterator(
+            chunk_size=BATCH_SIZE))
+    return FeedEntry.objects.count()
@@ -0,0 +1,279 @@
+"""
+Префиксный индекс ингредиентов для автодополнения.
+
+Каталог ингредиентов выгружается в файл, отсортированный по названию
+в нижнем регистре (`str.casefold`, «ё» приравнена к «е»), и открывается
+через `mmap`. Все
+воркеры одного хоста читают один и тот же файл, поэтому страницы
+индекса хранятся в памяти в единственном экземпляре (в page cache ОС),
+а поиск по префиксу — двоичный поиск без обращения к БД.
+
+Имя файла строится по состоянию каталога в БД (число ингредиентов,
+наибольший id и время последнего изменения), поэтому все воркеры
+и процессы с одними и теми же данными используют один файл. Состояние
+проверяется при смене общей версии каталога `INGREDIENTS`; если файла
+для него ещё нет, первый обратившийся воркер строит его. Файл пишется
+во временный и атомарно переименовывается, поэтому воркеры никогда
+не видят его недописанным.
+
+Формат файла:
+    заголовок: MAGIC, число записей (uint32);
+    таблица смещений записей (uint32 на запись);
+    записи `ключ \\x1f id \\x1f название \\x1f единица \\n` в UTF-8.
+"""
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+from foodgram_backend.cache_versions import INGREDIENTS, get_version
+
+from .models import Ingredient
+
+MAGIC = b'FGII2\n'
+HEADER = struct.Struct('<I')
+OFFSET = struct.Struct('<I')
+SEPARATOR = b'\x1f'
+TERMINATOR = b'\n'
+FILE_PREFIX = 'ingredients-'
+FILE_SUFFIX = '.idx'
+# Файлы других состояний каталога удаляются не раньше, чем через столько
+# секунд после последнего изменения: их могут как раз открывать воркеры,
+# ещё не заметившие смены версии.
+STALE_FILE_GRACE_PERIOD = 60
+
+_index = None
+
+
+def normalize(value):
+    return value.casefold().replace('ё', 'е')
+
+
+def get_index_dir():
+    return getattr(settings, 'INGREDIENT_INDEX_DIR', None) or os.path.join(
+        tempfile.gettempdir(), 'foodgram-ingredient-index')
+
+
+def get_index_path(state):
+    return os.path.join(
+        get_index_dir(), f'{FILE_PREFIX}{state}{FILE_SUFFIX}')
+
+
+def format_state(count, last_id, modified):
+    modified = int(modified.timestamp() * 10 ** 6) if modified else 0
+    return f'{count}-{last_id or 0}-{modified}'
+
+
+def get_catalog_state():
+    """
+    Состояние каталога в БД: меняется при добавлении, удалении
+    и изменении ингредиентов, в том числе из других процессов.
+    """
+    state = Ingredient.objects.aggregate(
+        count=Count('pk'), last_id=Max('pk'), modified=Max('modified'))
+    return format_state(state['count'], state['last_id'], state['modified'])
+
+
+def clean(value):
+    """Разделители записей в названиях заменяются пробелами."""
+    return value.replace('\x1f', ' ').replace('\n', ' ')
+
+
+def build_index():
+    """
+    Выгружает каталог в файл индекса и возвращает путь к нему. Имя
+    файла строится по состоянию тех же строк, что записаны в файл.
+    """
+    rows = []
+    last_id = modified = None
+    for pk, name, unit, changed in Ingredient.objects.values_list(
+            'pk', 'name', 'measurement_unit', 'modified'
+    ).order_by().iterator():
+        rows.append((normalize(clean(name)), clean(name), pk, clean(unit)))
+        last_id = pk if last_id is None else max(last_id, pk)
+        modified = changed if modified is None else max(modified, changed)
+    path = get_index_path(format_state(len(rows), last_id, modified))
+    write_index(path, rows)
+    remove_stale_files(keep=path)
+    return path
+
+
+def write_index(path, rows):
+    """
+    Записывает файл индекса из строк (ключ, название, id, единица).
+    """
+    rows = sorted(rows)
+    records = [
+        SEPARATOR.join((
+            key.encode(), str(pk).encode(), name.encode(), unit.encode()
+        )) + TERMINATOR
+        for key, name, pk, unit in rows
+    ]
+    data_start = len(MAGIC) + HEADER.size + OFFSET.size * len(records)
+    offsets = []
+    position = data_start
+    for record in records:
+        offsets.append(position)
+        position += len(record)
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(MAGIC)
+            file.write(HEADER.pack(len(records)))
+            file.write(b''.join(OFFSET.pack(offset) for offset in offsets))
+            file.writelines(records)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def remove_stale_files(keep):
+    """
+    Удаляет файлы других состояний каталога старше
+    STALE_FILE_GRACE_PERIOD. Удаление не затрагивает уже открытые
+    отображения: воркеры, держащие такой файл, читают его до перехода
+    на новое состояние. Воркер, не успевший открыть удалённый файл,
+    построит индекс заново.
+    """
+    directory = os.path.dirname(keep)
+    deadline = time.time() - STALE_FILE_GRACE_PERIOD
+    for filename in os.listdir(directory):
+        path = os.path.join(directory, filename)
+        if (not filename.startswith(FILE_PREFIX)
+                or not filename.endswith(FILE_SUFFIX) or path == keep):
+            continue
+        try:
+            if os.stat(path).st_mtime < deadline:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class IngredientIndex:
+    """
+    Открытый только для чтения файл индекса. `state` — состояние
+    каталога, по которому он построен (из имени файла).
+    """
+
+    def __init__(self, path):
+        name = os.path.basename(path)
+        self.state = name[len(FILE_PREFIX):-len(FILE_SUFFIX)]
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            self.buffer.close()
+            raise ValueError(f'Неверный формат индекса: {path}')
+        (self.count,) = HEADER.unpack_from(self.buffer, len(MAGIC))
+        self.offsets_start = len(MAGIC) + HEADER.size
+
+    def record_offset(self, number):
+        return OFFSET.unpack_from(
+            self.buffer, self.offsets_start + number * OFFSET.size)[0]
+
+    def key(self, number):
+        start = self.record_offset(number)
+        return self.buffer[start:self.buffer.find(SEPARATOR, start)]
+
+    def lower_bound(self, prefix):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < prefix:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def record(self, number):
+        """Ингредиент по номеру записи в индексе."""
+        start = self.record_offset(number)
+        end = self.buffer.find(TERMINATOR, start)
+        _, pk, name, unit = self.buffer[start:end].decode().split('\x1f')
+        return {'id': int(pk), 'name': name, 'measurement_unit': unit}
+
+    def keys(self):
+        """Нормализованные названия всех записей по порядку."""
+        start = self.record_offset(0) if self.count else len(self.buffer)
+        for record in self.buffer[start:-1].decode().split('\n'):
+            if record:
+                yield record.split('\x1f', 1)[0]
+
+    def search(self, prefix):
+        """Ингредиенты, название которых начинается с `prefix`."""
+        return self.search_range(prefix)[1]
+
+    def search_range(self, prefix, limit=None):
+        """
+        Номера первой и следующей за последней записей с префиксом
+        `prefix` и сами записи (не больше `limit`).
+        """
+        prefix = normalize(prefix).encode()
+        first = self.lower_bound(prefix)
+        # Байт 0xFF не встречается в UTF-8, поэтому все ключи с префиксом
+        # меньше `prefix + 0xFF`, и найденные записи идут подряд.
+        last = self.lower_bound(prefix + b'\xff')
+        if first == last:
+            return (first, last), []
+        stop = last if limit is None else min(last, first + limit)
+        start = self.record_offset(first)
+        end = (self.record_offset(stop) if stop < self.count
+               else len(self.buffer))
+        results = []
+        for record in self.buffer[start:end - 1].decode().split('\n'):
+            _, pk, name, unit = record.split('\x1f')
+            results.append(
+                {'id': int(pk), 'name': name, 'measurement_unit': unit})
+        return (first, last), results
+
+
+def get_index():
+    """
+    Индекс для текущего состояния каталога. Состояние читается из БД
+    только при смене общей версии `INGREDIENTS`; файл строится первым
+    воркером, которому он понадобился.
+    """
+    global _index
+    version = get_version(INGREDIENTS)
+    if _index is not None and _index[0] == version:
+        return _index[1]
+
+    try:
+        index = IngredientIndex(get_index_path(get_catalog_state()))
+    except (FileNotFoundError, ValueError):
+        index = IngredientIndex(build_index())
+    # Предыдущий индекс не закрывается явно: его ещё могут читать другие
+    # потоки воркера, отображение освободится вместе с объектом.
+    _index = (version, index)
+    return index
+
+
+def get_state():
+    """
+    Состояние каталога, по которому построен текущий индекс, без
+    запроса к БД, пока не сменилась версия `INGREDIENTS`. None, если
+    индекс недоступен.
+    """
+    try:
+        return get_index().state
+    except OSError:
+        return None
+
+
+def search(prefix):
+    """
+    Поиск ингредиентов по началу названия без учёта регистра.
+    Если индекс недоступен (например, нет прав на каталог), возвращает
+    None, и поиск выполняется через БД.
+    """
+    try:
+        return get_index().search(prefix)
+    except OSError:
+        return None
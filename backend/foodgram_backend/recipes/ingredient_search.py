@@ -0,0 +1,126 @@
+"""
+Нечёткий поиск ингредиентов по триграммам.
+
+Поверх префиксного индекса (`ingredient_index`) в памяти процесса
+строится инвертированный индекс: триграмма -> номера записей, в чьих
+названиях она встречается. Триграммы берутся, как в pg_trgm, из слов
+названия, дополненных двумя пробелами в начале и одним в конце, после
+приведения к нижнему регистру и замены «ё» на «е».
+
+Результаты поиска (не больше `INGREDIENT_SEARCH_LIMIT`): сначала
+совпадения по началу названия в порядке префиксного индекса, затем
+ингредиенты, похожие на запрос, — по убыванию доли триграмм запроса,
+найденных в названии (опечатки, совпадения в середине названия).
+"""
+import math
+import re
+from array import array
+from collections import Counter
+
+from django.conf import settings
+from foodgram_backend.constants import (INGREDIENT_FUZZY_MIN_LENGTH,
+                                        INGREDIENT_FUZZY_THRESHOLD)
+
+from . import ingredient_index
+
+WORD_PATTERN = re.compile(r'\w+')
+
+_trigrams = None
+
+
+def get_trigrams(value):
+    """Множество триграмм нормализованной строки."""
+    trigrams = set()
+    for word in WORD_PATTERN.findall(value):
+        padded = f'  {word} '
+        trigrams.update(
+            padded[position:position + 3]
+            for position in range(len(padded) - 2))
+    return trigrams
+
+
+class TrigramIndex:
+    """Инвертированный триграммный индекс по записям префиксного индекса."""
+
+    def __init__(self, index):
+        self.index = index
+        postings = {}
+        self.sizes = array('I')
+        for number, key in enumerate(index.keys()):
+            trigrams = get_trigrams(key)
+            self.sizes.append(len(trigrams))
+            for trigram in trigrams:
+                postings.setdefault(trigram, array('I')).append(number)
+        self.postings = postings
+
+    def similar(self, query, exclude=range(0), limit=None):
+        """
+        Номера записей, похожих на `query`, от наиболее похожих.
+        Записи из `exclude` (совпадения по префиксу) пропускаются.
+        """
+        trigrams = get_trigrams(ingredient_index.normalize(query))
+        if not trigrams:
+            return []
+        required = math.ceil(INGREDIENT_FUZZY_THRESHOLD * len(trigrams))
+        postings = sorted(
+            (self.postings.get(trigram, ()) for trigram in trigrams), key=len)
+        # Запись с `required` общими триграммами обязательно есть хотя бы
+        # в одном из `len(trigrams) - required + 1` самых коротких списков,
+        # поэтому кандидатами считаются только записи из них.
+        candidates = set().union(*postings[:len(trigrams) - required + 1])
+        shared_counts = Counter()
+        for numbers in postings:
+            shared_counts.update(numbers)
+
+        ranked = []
+        for number in candidates:
+            shared = shared_counts[number]
+            if shared < required or number in exclude:
+                continue
+            # Доля триграмм запроса в названии, при равенстве — сходство
+            # по Жаккару, чтобы короткие названия шли раньше длинных.
+            similarity = shared / (
+                len(trigrams) + self.sizes[number] - shared)
+            ranked.append((-shared, -similarity, number))
+        ranked.sort()
+        return [number for _, _, number in ranked[:limit]]
+
+    def search(self, query, limit):
+        """
+        Не больше `limit` ингредиентов: совпадения по началу названия,
+        затем похожие названия.
+        """
+        prefix_range, results = self.index.search_range(query, limit)
+        remaining = limit - len(results)
+        if (remaining > 0 and len(ingredient_index.normalize(query).strip())
+                >= INGREDIENT_FUZZY_MIN_LENGTH):
+            results += [
+                self.index.record(number)
+                for number in self.similar(
+                    query, exclude=range(*prefix_range), limit=remaining)
+            ]
+        return results
+
+
+def get_trigram_index():
+    """Триграммный индекс для текущей версии префиксного индекса."""
+    global _trigrams
+    index = ingredient_index.get_index()
+    if _trigrams is None or _trigrams.index is not index:
+        _trigrams = TrigramIndex(index)
+    return _trigrams
+
+
+def search(query, limit=None):
+    """
+    Не больше `limit` ингредиентов: совпадения по началу названия, затем
+    похожие названия. Если индекс недоступен, возвращает None, и поиск
+    выполняется через БД.
+    """
+    if limit is None:
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+    try:
+        trigram_index = get_trigram_index()
+    except OSError:
+        return None
+    return trigram_index.search(query, limit)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = ('Микробенчмарки быстрых путей API на данных текущей базы. '
+            'Без аргументов запускаются все сценарии.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*', metavar='name',
+            help=f'Сценарии: {", ".join(BENCHMARKS)}.')
+        parser.add_argument(
+            '--size', type=int, default=100,
+            help='Размер выборки в сценарии (например, число рецептов).')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Число повторов; выводится лучшее время.')
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = set(names) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}.')
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for label, milliseconds in BENCHMARKS[name](
+                    options['size'], options['repeat']):
+                self.stdout.write(f'  {label}: {milliseconds:.2f} мс')
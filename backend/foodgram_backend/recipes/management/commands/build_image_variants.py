@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from foodgram_backend.constants import BATCH_SIZE, IMAGE_VARIANTS_POLL_INTERVAL
+from foodgram_backend.images import build_variants, get_pending
+from recipes.signals import MEDIA_FIELDS, VARIANT_SIZES
+
+
+class Command(BaseCommand):
+    help = ('Построение уменьшенных копий и WebP-вариантов изображений '
+            'рецептов и аватаров, для которых их ещё нет. С --loop '
+            'работает постоянно как отдельный воркер.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Не завершаться, а ждать новых изображений.')
+        parser.add_argument(
+            '--interval', type=float, default=IMAGE_VARIANTS_POLL_INTERVAL,
+            help='Пауза в секундах, когда необработанных изображений нет.')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Число объектов, выбираемых одним запросом.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        started = time.monotonic()
+        built = failed = 0
+        while True:
+            batch_built, batch_failed = self.build_pending()
+            built += batch_built
+            failed += batch_failed
+            if batch_built or batch_failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Построены варианты {built} изображений за '
+            f'{time.monotonic() - started:.1f} с, не удалось обработать: '
+            f'{failed}.'))
+
+    def build_pending(self):
+        """Строит варианты для пачки объектов каждой модели."""
+        built = failed = 0
+        for model, (field_name, variants_field) in MEDIA_FIELDS.items():
+            pending = get_pending(
+                model, field_name, variants_field
+            ).order_by('pk').values_list(
+                'pk', field_name)[:self.options['batch_size']]
+            for pk, name in pending:
+                variants = build_variants(
+                    model, pk, name, field_name, variants_field,
+                    VARIANT_SIZES[model])
+                if variants.get('failed'):
+                    failed += 1
+                else:
+                    built += 1
+                if self.options['verbosity'] > 1:
+                    self.stdout.write(name)
+        return built, failed
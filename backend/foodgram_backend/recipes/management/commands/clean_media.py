@@ -0,0 +1,107 @@
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from foodgram_backend.constants import BATCH_SIZE, MEDIA_GC_GRACE_PERIOD
+from recipes.media import delete_unreferenced
+from recipes.models import MediaFile, Recipe
+
+User = get_user_model()
+
+
+def walk_files(root):
+    """
+    Файлы каталога и его подкаталогов: (имя в хранилище, mtime, размер).
+    Каталоги читаются по одной записи, список файлов целиком не строится.
+    """
+    base = default_storage.path('')
+    stack = [default_storage.path(root)]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    name = os.path.relpath(entry.path, base)
+                    yield (name.replace(os.sep, '/'), stat.st_mtime,
+                           stat.st_size)
+
+
+class Command(BaseCommand):
+    help = ('Удаление загруженных изображений и их вариантов, на которые '
+            'нет ссылок из рецептов и аватаров. Каталоги обходятся потоково, '
+            'пачками по --batch-size файлов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько файлов будет удалено.')
+        parser.add_argument(
+            '--grace-period', type=int, default=MEDIA_GC_GRACE_PERIOD,
+            help='Не удалять файлы моложе указанного числа секунд.')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Число файлов, проверяемых одним запросом.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        started = time.monotonic()
+        self.deadline = time.time() - options['grace_period']
+        scanned = deleted = freed = 0
+        roots = {
+            Recipe._meta.get_field('image').upload_to,
+            User._meta.get_field('avatar').upload_to,
+        }
+        for root in sorted(roots):
+            files = walk_files(root)
+            for batch in iter(
+                    lambda: list(islice(files, options['batch_size'])), []):
+                scanned += len(batch)
+                count, size = self.clean_batch(batch)
+                deleted += count
+                freed += size
+
+        # Записи о файлах без ссылок, которые не удалось удалить сразу.
+        stale = MediaFile.objects.filter(references__lte=0).values_list(
+            'name', flat=True)
+        stale_count = stale.count()
+        if not options['dry_run']:
+            names = stale.iterator(chunk_size=options['batch_size'])
+            for batch in iter(
+                    lambda: list(islice(names, options['batch_size'])), []):
+                delete_unreferenced(batch, options['grace_period'])
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено {scanned} файлов за '
+            f'{time.monotonic() - started:.1f} с. {action} {deleted} файлов '
+            f'({freed / 1024 / 1024:.1f} МБ), записей без ссылок: '
+            f'{stale_count}.'))
+
+    def clean_batch(self, batch):
+        """Удаляет файлы пачки без ссылок; возвращает их число и размер."""
+        referenced = set(MediaFile.objects.filter(
+            name__in=[name for name, _, _ in batch], references__gt=0
+        ).values_list('name', flat=True))
+        sizes = {
+            name: size for name, mtime, size in batch
+            if name not in referenced and mtime < self.deadline}
+        if not sizes:
+            return 0, 0
+        if self.options['dry_run']:
+            names = list(sizes)
+        else:
+            names = delete_unreferenced(
+                list(sizes), self.options['grace_period'])
+        if self.options['verbosity'] > 1:
+            for name in names:
+                self.stdout.write(name)
+        return len(names), sum(sizes[name] for name in names)
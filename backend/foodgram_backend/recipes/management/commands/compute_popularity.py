@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from foodgram_backend.constants import (POPULARITY_HALF_LIFE_HOURS,
+                                        POPULARITY_WINDOW_DAYS)
+from recipes import popularity
+
+
+class Command(BaseCommand):
+    help = ('Пересчёт популярности рецептов по добавлениям в избранное '
+            'и в списки покупок с затуханием по времени. Запускается '
+            'периодически, например раз в час.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window-days', type=int, default=POPULARITY_WINDOW_DAYS,
+            help='Учитываемый период в днях.')
+        parser.add_argument(
+            '--half-life-hours', type=int, default=POPULARITY_HALF_LIFE_HOURS,
+            help='Период полураспада вклада добавления в часах.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = popularity.recompute(
+            window_days=options['window_days'],
+            half_life_hours=options['half_life_hours'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярность пересчитана для {count} рецептов '
+            f'за {time.monotonic() - started:.1f} с.'))
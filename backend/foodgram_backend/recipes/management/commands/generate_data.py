@@ -0,0 +1,318 @@
+import io
+import math
+import multiprocessing
+import random
+import string
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from foodgram_backend.cache_versions import (AUTHORS, RECIPE_FRAGMENTS,
+                                             RECIPES, TAGS, bump_version)
+from foodgram_backend.constants import MAX_TIME
+from PIL import Image
+from recipes import counters, feed, popularity, shopping_list
+from recipes.media import change_references
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, ShortLink, Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+CHUNK_SIZE = 5000
+IMAGE_NAME = 'recipes/images/generated.png'
+DEFAULT_TAGS = (
+    ('Завтрак', 'breakfast'), ('Обед', 'lunch'), ('Ужин', 'dinner'),
+    ('Десерт', 'dessert'), ('Выпечка', 'baking'), ('Суп', 'soup'),
+    ('Салат', 'salad'), ('Вегетарианское', 'vegetarian'),
+)
+DISHES = (
+    'суп', 'салат', 'пирог', 'рагу', 'омлет', 'каша', 'запеканка',
+    'паста', 'плов', 'котлеты', 'блины', 'оладьи', 'суфле', 'жаркое',
+    'торт', 'кекс', 'соус', 'гратен', 'ризотто', 'борщ',
+)
+ADJECTIVES = (
+    'домашний', 'быстрый', 'летний', 'зимний', 'праздничный', 'лёгкий',
+    'сытный', 'бабушкин', 'острый', 'нежный', 'пряный', 'постный',
+)
+AMOUNTS = {
+    'г': (10, 20, 50, 100, 150, 200, 250, 300, 400, 500, 1000),
+    'кг': (1, 2),
+    'мл': (10, 30, 50, 100, 200, 250, 500, 1000),
+    'л': (1, 2),
+}
+DEFAULT_AMOUNTS = (1, 1, 1, 2, 2, 3, 4, 5)
+
+# Данные для процессов-воркеров: при запуске через fork они наследуются
+# от родительского процесса и не передаются с каждой задачей.
+_context = {}
+
+
+def zipf_cum_weights(size, exponent):
+    """Накопленные веса распределения Ципфа для `size` элементов."""
+    return list(accumulate(1 / (rank ** exponent)
+                           for rank in range(1, size + 1)))
+
+
+def chunk_random(seed, phase, number):
+    """Генератор случайных чисел задачи: не зависит от числа воркеров."""
+    return random.Random(f'{seed}:{phase}:{number}')
+
+
+def generate_recipes(number, start, stop):
+    """Рецепты с ингредиентами, тегами и короткими ссылками."""
+    options = _context['options']
+    rng = chunk_random(options['seed'], 'recipes', number)
+    author_ids = _context['author_ids']
+    ingredients = _context['ingredients']
+    tag_ids = _context['tag_ids']
+
+    recipes = []
+    for position in range(start, stop):
+        author_id = rng.choices(
+            author_ids, cum_weights=_context['author_weights'])[0]
+        recipes.append(Recipe(
+            author_id=author_id,
+            name=(f'{rng.choice(ADJECTIVES).capitalize()} '
+                  f'{rng.choice(DISHES)} №{position + 1}'),
+            image=_context['image_name'],
+            text=f'Сгенерированный рецепт №{position + 1}.',
+            cooking_time=max(1, min(MAX_TIME, round(
+                rng.lognormvariate(math.log(35), 0.6))))))
+    Recipe.objects.bulk_create(recipes)
+
+    recipe_ingredients = []
+    recipe_tags = []
+    short_links = []
+    for recipe in recipes:
+        count = min(len(ingredients), max(1, round(rng.gauss(7, 3))))
+        chosen = set()
+        while len(chosen) < count:
+            chosen.add(rng.choices(
+                range(len(ingredients)),
+                cum_weights=_context['ingredient_weights'])[0])
+        for index in chosen:
+            ingredient_id, unit = ingredients[index]
+            recipe_ingredients.append(IngredientInRecipe(
+                recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                amount=rng.choice(AMOUNTS.get(unit, DEFAULT_AMOUNTS))))
+        for tag_id in rng.sample(
+                tag_ids, min(len(tag_ids), rng.choice((1, 1, 2, 2, 3)))):
+            recipe_tags.append(Recipe.tags.through(
+                recipe_id=recipe.pk, tag_id=tag_id))
+        if rng.random() < options['short_link_share']:
+            short_links.append(ShortLink(
+                recipe_id=recipe.pk, short_code=''.join(rng.choices(
+                    string.ascii_letters + string.digits, k=6))))
+
+    batch_size = options['batch_size']
+    IngredientInRecipe.objects.bulk_create(
+        recipe_ingredients, batch_size=batch_size)
+    Recipe.tags.through.objects.bulk_create(
+        recipe_tags, batch_size=batch_size)
+    # Совпавший короткий код просто оставляет рецепт без ссылки.
+    ShortLink.objects.bulk_create(
+        short_links, batch_size=batch_size, ignore_conflicts=True)
+    return [recipe.pk for recipe in recipes], len(recipe_ingredients)
+
+
+def generate_user_relations(number, user_ids):
+    """Подписки, избранное и корзины пользователей."""
+    options = _context['options']
+    rng = chunk_random(options['seed'], 'relations', number)
+    author_ids = _context['author_ids']
+    recipe_ids = _context['recipe_ids']
+    recipe_weights = _context['recipe_weights']
+
+    def pick(population, cum_weights, average, exclude=None):
+        count = min(len(population), round(rng.expovariate(1 / average)))
+        chosen = set()
+        for _ in range(count * 2):
+            if len(chosen) >= count:
+                break
+            chosen.add(rng.choices(population, cum_weights=cum_weights)[0])
+        chosen.discard(exclude)
+        return chosen
+
+    follows = []
+    favorites = []
+    carts = []
+    for user_id in user_ids:
+        follows += [
+            Follow(user_id=user_id, author_id=author_id)
+            for author_id in pick(
+                author_ids, _context['author_weights'],
+                options['follows'], exclude=user_id)]
+        if not recipe_ids:
+            continue
+        favorites += [
+            Favorite(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in pick(
+                recipe_ids, recipe_weights, options['favorites'])]
+        carts += [
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for recipe_id in pick(
+                recipe_ids, recipe_weights, options['carts'])]
+
+    batch_size = options['batch_size']
+    Follow.objects.bulk_create(follows, batch_size=batch_size)
+    Favorite.objects.bulk_create(favorites, batch_size=batch_size)
+    ShoppingCart.objects.bulk_create(carts, batch_size=batch_size)
+    return len(follows), len(favorites), len(carts)
+
+
+class Command(BaseCommand):
+    help = ('Генерация пользователей, рецептов, подписок, избранного, '
+            'корзин и коротких ссылок для нагрузочного тестирования')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=float, default=5,
+            help='Среднее число подписок пользователя.')
+        parser.add_argument(
+            '--favorites', type=float, default=10,
+            help='Среднее число рецептов в избранном пользователя.')
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Среднее число рецептов в корзине пользователя.')
+        parser.add_argument(
+            '--short-link-share', type=float, default=0.2,
+            help='Доля рецептов с короткой ссылкой.')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: с одним зерном данные совпадают.')
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов. Для SQLite оставьте 1.')
+        parser.add_argument('--batch-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self.options = options
+        prefix = f'gen{options["seed"]}_'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Данные с зерном {options["seed"]} уже сгенерированы, '
+                f'укажите другой --seed.')
+        ingredients = list(Ingredient.objects.order_by('pk').values_list(
+            'pk', 'measurement_unit'))
+        if not ingredients:
+            raise CommandError(
+                'Нет ингредиентов, сначала выполните import_ingredients.')
+
+        rng = random.Random(options['seed'])
+        rng.shuffle(ingredients)
+        _context.update(
+            options=options,
+            ingredients=ingredients,
+            ingredient_weights=zipf_cum_weights(len(ingredients), 1.0),
+            tag_ids=self.ensure_tags(),
+        )
+        # У всех сгенерированных рецептов одна картинка. Хранилище
+        # называет файлы по содержимому, поэтому она не дублируется.
+        buffer = io.BytesIO()
+        Image.new('RGB', (1, 1), 'white').save(buffer, 'PNG')
+        _context['image_name'] = default_storage.save(
+            IMAGE_NAME, ContentFile(buffer.getvalue()))
+
+        user_ids = self.create_users(prefix)
+        author_ids = user_ids[:]
+        rng.shuffle(author_ids)
+        _context.update(
+            author_ids=author_ids,
+            author_weights=zipf_cum_weights(len(author_ids), 0.8))
+        self.report('Пользователи', len(user_ids), started)
+
+        tasks = [
+            (number, start, min(start + options['batch_size'],
+                                options['recipes']))
+            for number, start in enumerate(
+                range(0, options['recipes'], options['batch_size']))]
+        recipe_ids = []
+        recipe_ingredients = 0
+        for ids, ingredient_count in self.run(generate_recipes, tasks):
+            recipe_ids += ids
+            recipe_ingredients += ingredient_count
+        self.report('Рецепты', len(recipe_ids), started)
+        self.report('Ингредиенты в рецептах', recipe_ingredients, started)
+
+        rng.shuffle(recipe_ids)
+        _context.update(
+            recipe_ids=recipe_ids,
+            recipe_weights=zipf_cum_weights(len(recipe_ids), 0.9))
+        tasks = [
+            (number, user_ids[start:start + options['batch_size']])
+            for number, start in enumerate(
+                range(0, len(user_ids), options['batch_size']))]
+        totals = [0, 0, 0]
+        for counts in self.run(generate_user_relations, tasks):
+            totals = [total + count for total, count in zip(totals, counts)]
+        for label, total in zip(
+                ('Подписки', 'Избранное', 'Корзины'), totals):
+            self.report(label, total, started)
+
+        # Массовые вставки не вызывают сигналы: пересобираем списки
+        # покупок, ленты, счётчики и популярность, учитываем ссылки
+        # на картинку и сбрасываем кеши явно.
+        shopping_list.rebuild()
+        self.report('Записи лент', feed.rebuild(), started)
+        self.report(
+            'Исправлено счётчиков', sum(counters.repair().values()), started)
+        self.report('Оценки популярности', popularity.recompute(), started)
+        change_references({_context['image_name']: len(recipe_ids)})
+        bump_version(RECIPES, RECIPE_FRAGMENTS, AUTHORS, TAGS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с.'))
+
+    def ensure_tags(self):
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        if not tag_ids:
+            tag_ids = [tag.pk for tag in Tag.objects.bulk_create(
+                Tag(name=name, slug=slug) for name, slug in DEFAULT_TAGS)]
+        return tag_ids
+
+    def create_users(self, prefix):
+        # Хеш пароля считается один раз: это самая медленная часть
+        # создания пользователя.
+        password = make_password(f'{prefix}password')
+        user_ids = []
+        batch_size = self.options['batch_size']
+        for start in range(0, self.options['users'], batch_size):
+            users = [
+                User(username=f'{prefix}{number}',
+                     email=f'{prefix}{number}@example.com',
+                     first_name='Имя', last_name=f'Фамилия {number}',
+                     password=password)
+                for number in range(
+                    start, min(start + batch_size, self.options['users']))]
+            user_ids += [
+                user.pk for user in User.objects.bulk_create(users)]
+        return user_ids
+
+    def run(self, function, tasks):
+        """Выполняет задачи в текущем процессе или в пуле воркеров."""
+        if self.options['workers'] <= 1:
+            for task in tasks:
+                yield function(*task)
+            return
+        # Соединения родителя нельзя использовать в дочерних процессах:
+        # закрываем их до fork, воркеры откроют собственные.
+        connections.close_all()
+        with ProcessPoolExecutor(
+                max_workers=self.options['workers'],
+                mp_context=multiprocessing.get_context('fork')) as executor:
+            futures = [executor.submit(function, *task) for task in tasks]
+            for future in futures:
+                yield future.result()
+
+    def report(self, label, count, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(f'{label}: {count} ({elapsed:.1f} с)')
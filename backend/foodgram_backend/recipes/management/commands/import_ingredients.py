@@ -1,87 +1,197 @@
+import csv
 import json
 import os
+import time
+from itertools import islice
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
-from foodgram_backend.constants import BATCH_SIZE
+from django.core.management.base import BaseCommand, CommandError
+from foodgram_backend.cache_versions import INGREDIENTS, bump_version
+from foodgram_backend.constants import (BATCH_SIZE, INGREDIENT_MAX_LENGTH,
+                                        MEASUREMENT_UNIT_MAX_LENGTH)
 from recipes.models import Ingredient
 
+FORMATS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+JSON_CHUNK_SIZE = 64 * 1024
+# Наибольший размер одного элемента JSON-массива: если элемент не
+# разобрался и в таком объёме, файл некорректен, дальше не читается.
+JSON_MAX_ITEM_SIZE = 64 * 1024
+PROGRESS_EVERY_BATCHES = 50
 
-class Command(BaseCommand):
-    help = 'Импорт ингредиентов из ingredients.json'
 
-    def handle(self, *args, **options):
-        json_file_path = os.path.join(
-            settings.BASE_DIR, 'data', 'ingredients.json')
+def read_csv(file):
+    """Строки `название,единица измерения`; заголовок пропускается."""
+    for row in csv.reader(file):
+        if len(row) < 2:
+            yield {}
+            continue
+        if row[:2] == ['name', 'measurement_unit']:
+            continue
+        yield {'name': row[0], 'measurement_unit': row[1]}
 
-        if not os.path.exists(json_file_path):
-            self.stdout.write(
-                self.style.ERROR(f'Файл {json_file_path} не найден!')
-            )
-            return
 
-        with open(json_file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+def read_ndjson(file):
+    """По одному JSON-объекту на строку."""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
 
-        ingredients_to_create = []
-        seen_names = set()
-        duplicates = 0
-        invalid_items = 0
 
-        existing_names = set(Ingredient.objects.values_list('name', flat=True))
+def read_json(file):
+    """
+    Элементы JSON-массива по одному: файл читается блоками, и в памяти
+    хранится только текущий блок. Элемент, не разобранный в пределах
+    JSON_MAX_ITEM_SIZE, считается ошибкой.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
 
-        for item in data:
-            name = item.get('name')
-            measurement_unit = item.get('measurement_unit')
+    def fill():
+        nonlocal buffer, position
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        return bool(chunk)
 
-            if not name or not measurement_unit:
-                invalid_items += 1
-                self.stdout.write(
-                    self.style.WARNING(f"Пропущен неполный элемент: {item}")
-                )
-                continue
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            if not fill():
+                break
+            continue
+        if not started:
+            if buffer[position] != '[':
+                raise CommandError('Ожидается JSON-массив ингредиентов.')
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # Объект не поместился в прочитанную часть файла, если он
+            # не длиннее JSON_MAX_ITEM_SIZE; иначе он некорректен.
+            if len(buffer) - position >= JSON_MAX_ITEM_SIZE or not fill():
+                raise
+            continue
+        position = end
+        yield item
+    raise CommandError('Неожиданный конец JSON-файла.')
 
-            if name in seen_names:
-                duplicates += 1
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"Повторяющийся ингредиент в JSON: {name}")
-                )
-                continue
 
-            if name in existing_names:
-                duplicates += 1
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"Ингредиент '{name}' уже существует в базе.")
-                )
-                continue
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_ndjson,
+}
+
 
-            ingredients_to_create.append(
-                Ingredient(name=name, measurement_unit=measurement_unit)
-            )
-            seen_names.add(name)
-
-        if ingredients_to_create:
-            Ingredient.objects.bulk_create(
-                ingredients_to_create, batch_size=BATCH_SIZE)
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Успешно добавлено {len(ingredients_to_create)} '
-                    f'ингредиентов.')
-            )
-        else:
-            self.stdout.write(
-                self.style.WARNING('Нет новых ингредиентов для добавления.')
-            )
+class Command(BaseCommand):
+    help = ('Потоковый импорт ингредиентов из CSV, JSON или NDJSON. '
+            'Уже существующие пары (название, единица измерения) '
+            'пропускаются, поэтому импорт можно запускать повторно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(
+                settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Путь к файлу (по умолчанию data/ingredients.csv).')
+        parser.add_argument(
+            '--format', choices=sorted(READERS),
+            help='Формат файла; по умолчанию определяется по расширению.')
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Число строк в одной вставке.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or FORMATS.get(
+            os.path.splitext(path)[1].lower())
+        if file_format is None:
+            raise CommandError(
+                'Не удалось определить формат файла, укажите --format.')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден!')
+        self.verbosity = options['verbosity']
+        batch_size = options['batch_size']
 
+        processed = invalid_items = 0
+        count_before = Ingredient.objects.count()
+        started = time.monotonic()
+        with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+            items = READERS[file_format](file)
+            try:
+                for number, batch in enumerate(
+                        iter(lambda: list(islice(items, batch_size)), []),
+                        start=1):
+                    ingredients, invalid = self.build_batch(batch)
+                    Ingredient.objects.bulk_create(
+                        ingredients, batch_size=batch_size,
+                        ignore_conflicts=True)
+                    processed += len(batch)
+                    invalid_items += invalid
+                    if number % PROGRESS_EVERY_BATCHES == 0:
+                        self.report_progress(processed, started)
+            except (ValueError, csv.Error) as error:
+                # Уже загруженные пачки остаются в базе: повторный запуск
+                # после исправления файла пропустит их как существующие.
+                if processed:
+                    bump_version(INGREDIENTS)
+                raise CommandError(
+                    f'Ошибка разбора файла после {processed} строк: {error}')
+
+        added = Ingredient.objects.count() - count_before
+        if added:
+            bump_version(INGREDIENTS)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {processed} строк за {elapsed:.1f} с '
+            f'({processed / max(elapsed, 1e-9):.0f} строк/с), '
+            f'добавлено {added} ингредиентов.'))
         if invalid_items:
-            self.stdout.write(
-                self.style.WARNING(
-                    f'Пропущено {invalid_items} '
-                    f'элементов из-за отсутствия данных.')
-            )
-        if duplicates:
-            self.stdout.write(
-                self.style.WARNING(f'Пропущено {duplicates} дубликатов.')
-            )
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено {invalid_items} '
+                f'элементов из-за отсутствия данных.'))
+        skipped = processed - invalid_items - added
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено {skipped} дубликатов '
+                f'и уже существующих ингредиентов.'))
+
+    def build_batch(self, batch):
+        """Ингредиенты пачки без повторов и число неполных элементов."""
+        ingredients = {}
+        invalid = 0
+        for item in batch:
+            if not isinstance(item, dict):
+                item = {}
+            name = str(item.get('name') or '').strip()
+            measurement_unit = str(item.get('measurement_unit') or '').strip()
+            if (not name or not measurement_unit
+                    or len(name) > INGREDIENT_MAX_LENGTH
+                    or len(measurement_unit) > MEASUREMENT_UNIT_MAX_LENGTH):
+                invalid += 1
+                if self.verbosity > 1:
+                    self.stdout.write(self.style.WARNING(
+                        f'Пропущен неполный элемент: {item}'))
+                continue
+            ingredients.setdefault(
+                (name, measurement_unit),
+                Ingredient(name=name, measurement_unit=measurement_unit))
+        return list(ingredients.values()), invalid
+
+    def report_progress(self, processed, started):
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Обработано {processed} строк, '
+            f'{processed / max(elapsed, 1e-9):.0f} строк/с.')
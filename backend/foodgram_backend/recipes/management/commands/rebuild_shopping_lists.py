@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = ('Пересборка сохранённых списков покупок по рецептам в корзинах '
+            'или проверка их согласованности (--check)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить списки покупок, ничего не изменяя.')
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя (можно указать несколько раз).')
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+
+        if options['check']:
+            inconsistencies = shopping_list.find_inconsistencies(user_ids)
+            for user_id, ingredient_id, expected, stored in inconsistencies:
+                self.stdout.write(self.style.WARNING(
+                    f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                    f'ожидается {expected}, сохранено {stored}.'))
+            if inconsistencies:
+                raise CommandError(
+                    f'Найдено расхождений: {len(inconsistencies)}.')
+            self.stdout.write(
+                self.style.SUCCESS('Списки покупок согласованы.'))
+            return
+
+        created = shopping_list.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, позиций: {created}.'))
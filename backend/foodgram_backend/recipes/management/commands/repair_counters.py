@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = ('Сверка счётчиков избранного, списков покупок, рецептов '
+            'и подписчиков с данными и исправление расхождений')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить счётчики, ничего не изменяя.')
+        parser.add_argument(
+            '--batch-size', type=int, default=counters.REPAIR_BATCH_SIZE,
+            help='Число строк, проверяемых одним запросом.')
+
+    def handle(self, *args, **options):
+        drift = counters.repair(options['check'], options['batch_size'])
+        for field, count in drift.items():
+            if count:
+                self.stdout.write(self.style.WARNING(
+                    f'{field}: расхождений {count}.'))
+        total = sum(drift.values())
+        if options['check']:
+            if total:
+                raise CommandError(f'Найдено расхождений: {total}.')
+            self.stdout.write(self.style.SUCCESS('Счётчики согласованы.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков: {total}.'))
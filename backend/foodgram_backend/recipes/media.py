@@ -0,0 +1,83 @@
+"""
+Учёт ссылок на загруженные файлы.
+
+Файлы хранятся под именами по хешу содержимого
+(`foodgram_backend.storage.ContentAddressedStorage`), поэтому один файл
+может быть изображением нескольких рецептов и аватаром нескольких
+пользователей. Для каждого файла в `MediaFile` хранится число ссылок
+на него; файл удаляется после фиксации транзакции, в которой ссылок
+не осталось.
+"""
+from datetime import timedelta
+from functools import partial
+from itertools import groupby
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from foodgram_backend.constants import MEDIA_GC_GRACE_PERIOD
+
+from .models import MediaFile
+
+
+def get_file_names(name, variants):
+    """Файл изображения и его варианты, если они построены для него."""
+    if not name:
+        return set()
+    names = {name}
+    if (variants or {}).get('source') == name:
+        for paths in variants['sizes'].values():
+            names.update((paths['url'], paths['webp']))
+    return names
+
+
+def change_references(counts):
+    """
+    Изменяет число ссылок на файлы: `counts` — {имя файла: изменение}.
+    Файлы, ссылки на которые удалены, проверяются после фиксации
+    транзакции и удаляются, если ссылок не осталось.
+    """
+    counts = {name: delta for name, delta in counts.items() if delta}
+    if not counts:
+        return
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name) for name, delta in counts.items() if delta > 0],
+        ignore_conflicts=True)
+    for delta, items in groupby(
+            sorted(counts.items(), key=lambda item: item[1]),
+            key=lambda item: item[1]):
+        MediaFile.objects.filter(
+            name__in=[name for name, _ in items]
+        ).update(references=F('references') + delta)
+    released = [name for name, delta in counts.items() if delta < 0]
+    if released:
+        transaction.on_commit(partial(delete_unreferenced, released))
+
+
+def delete_unreferenced(names, grace_period=MEDIA_GC_GRACE_PERIOD):
+    """
+    Удаляет файлы из `names`, на которые нет ссылок, и возвращает их
+    имена. Файлы, изменённые позже чем `grace_period` секунд назад,
+    остаются: такой файл мог быть только что загружен повторно, а ссылка
+    на него ещё не записана. Их удалит команда `clean_media`.
+    """
+    deadline = timezone.now() - timedelta(seconds=grace_period)
+    deleted = []
+    with transaction.atomic():
+        # Блокировка не даёт одновременно добавить ссылку на удаляемый файл.
+        references = dict(
+            MediaFile.objects.select_for_update()
+            .filter(name__in=names).values_list('name', 'references'))
+        for name in names:
+            if references.get(name, 0) > 0:
+                continue
+            try:
+                if default_storage.get_modified_time(name) > deadline:
+                    continue
+                default_storage.delete(name)
+            except OSError:
+                pass
+            deleted.append(name)
+        MediaFile.objects.filter(name__in=deleted, references__lte=0).delete()
+    return deleted
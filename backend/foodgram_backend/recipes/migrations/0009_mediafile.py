@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:21
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def get_file_names(name, variants):
+    if not name:
+        return set()
+    names = {name}
+    if (variants or {}).get('source') == name:
+        for paths in variants['sizes'].values():
+            names.update(paths.values())
+    return names
+
+
+def count_references(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    User = apps.get_model('users', 'User')
+    MediaFile = apps.get_model('recipes', 'MediaFile')
+    counts = Counter()
+    for model, fields in ((Recipe, ('image', 'image_variants')),
+                          (User, ('avatar', 'avatar_variants'))):
+        for name, variants in model.objects.values_list(*fields).iterator():
+            counts.update(get_file_names(name, variants))
+    MediaFile.objects.bulk_create(
+        [MediaFile(name=name, references=references)
+         for name, references in counts.items()],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_variants'),
+        ('users', '0002_user_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Путь')),
+                ('references', models.IntegerField(default=0, verbose_name='Число ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл',
+                'verbose_name_plural': 'Файлы',
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
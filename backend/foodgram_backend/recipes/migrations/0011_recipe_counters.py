@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, key):
+    return Coalesce(Subquery(
+        model.objects.filter(**{key: OuterRef('pk')}).order_by().values(
+            key).annotate(count=Count('pk')).values('count')), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('users', 'Follow')
+    Recipe.objects.update(
+        favorites_count=count_related(Favorite, 'recipe_id'),
+        in_carts_count=count_related(ShoppingCart, 'recipe_id'))
+    User.objects.update(
+        recipes_count=count_related(Recipe, 'author_id'),
+        followers_count=count_related(Follow, 'author_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feedentry'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном (раз)'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок (раз)'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.5 on 2026-10-18 09:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_ingredient_modified'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipepopularity',
+            name='computed',
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                verbose_name='Время пересчёта'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,188 @@
+import gzip
+import hashlib
+import json
+import re
+from datetime import datetime
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from foodgram_backend.cache_versions import get_versions, user_state
+from foodgram_backend.constants import CATALOG_CACHE_TIMEOUT
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ACCEPT_ENCODING_PATTERN = re.compile(
+    r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?')
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы (ETag / Last-Modified) для `list` и `retrieve`.
+
+    Валидаторы строятся из версий данных и полей объекта без сериализации,
+    поэтому при совпадении `If-None-Match` сразу возвращается 304.
+    Если ответ зависит от пользователя (`vary_on_user`), в валидатор
+    входят id пользователя и версия его избранного, списка покупок
+    и подписок.
+    """
+    validator_versions = ()
+    vary_on_user = False
+
+    def get_validator_versions(self, instance=None):
+        names = list(self.validator_versions)
+        user = self.request.user
+        if self.vary_on_user and user.is_authenticated:
+            names.append(user_state(user.id))
+        return names
+
+    def get_validator_state(self):
+        """
+        Части ETag, прочитанные из БД. Меняются вместе с данными, даже
+        если версия в кеше не была увеличена или была вытеснена. Время
+        (datetime) из них учитывается и в Last-Modified.
+        """
+        return []
+
+    def get_object_validators(self, instance):
+        """Возвращает части ETag объекта и время его изменения."""
+        return [instance.pk], None
+
+    def get_validators(self, instance=None):
+        versions = get_versions(*self.get_validator_versions(instance))
+        state = self.get_validator_state()
+        parts = [self.request.get_full_path(), *versions, *state]
+        if self.vary_on_user:
+            parts.append(self.request.user.pk)
+        timestamps = [version / 10 ** 9 for version in versions] + [
+            part.timestamp() for part in state if isinstance(part, datetime)]
+        if instance is not None:
+            object_parts, modified = self.get_object_validators(instance)
+            parts += object_parts
+            if modified is not None:
+                parts.append(modified.isoformat())
+                timestamps.append(modified.timestamp())
+        etag = quote_etag(hashlib.md5(
+            json.dumps(parts, default=str).encode(),
+            usedforsecurity=False).hexdigest())
+        last_modified = int(max(timestamps)) if timestamps else None
+        return etag, last_modified
+
+    def get_conditional_response(self, instance, get_response):
+        etag, last_modified = self.get_validators(instance)
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = get_response()
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        if self.vary_on_user:
+            patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            None, lambda: super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        return self.get_conditional_response(
+            instance,
+            lambda: Response(self.get_serializer(instance).data))
+
+
+def get_accepted_encodings(request):
+    """Кодировки из заголовка Accept-Encoding, кроме явно запрещённых q=0."""
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        match = ACCEPT_ENCODING_PATTERN.match(part)
+        if not match:
+            continue
+        encoding, quality = match.groups()
+        try:
+            if quality is not None and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(encoding.lower())
+    return accepted
+
+
+class PrecompressedListMixin(ConditionalGetMixin):
+    """
+    Полный список без параметров запроса отдаётся готовым телом из кеша.
+
+    Тело рендерится один раз на ETag (версии `validator_versions`
+    и состояние из `get_validator_state`) и хранится вместе со сжатыми
+    gzip и brotli (если установлен пакет brotli) вариантами. Клиент
+    получает вариант по Accept-Encoding; ETag у каждого варианта свой,
+    ответ содержит `Vary: Accept-Encoding`.
+    """
+    content_encoding = None
+    catalog_etag = None
+
+    def get_content_encoding(self):
+        accepted = get_accepted_encodings(self.request)
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def is_precompressed(self):
+        return (not self.request.query_params
+                and isinstance(self.request.accepted_renderer, JSONRenderer))
+
+    def get_validators(self, instance=None):
+        etag, last_modified = super().get_validators(instance)
+        self.catalog_etag = etag
+        if self.content_encoding is not None:
+            etag = f'{etag[:-1]}-{self.content_encoding}"'
+        return etag, last_modified
+
+    def get_rendered_bodies(self):
+        if self.catalog_etag is None:
+            self.get_validators()
+        key = f'catalog:{self.request.path}:{self.catalog_etag}'
+        bodies = cache.get(key)
+        if bodies is None:
+            content = self.request.accepted_renderer.render(
+                self.get_serializer(
+                    self.filter_queryset(self.get_queryset()), many=True
+                ).data,
+                self.request.accepted_media_type,
+                self.get_renderer_context())
+            bodies = {
+                None: content,
+                'gzip': gzip.compress(content, compresslevel=9, mtime=0),
+            }
+            if brotli is not None:
+                bodies['br'] = brotli.compress(content)
+            cache.set(key, bodies, CATALOG_CACHE_TIMEOUT)
+        return bodies
+
+    def get_precompressed_response(self):
+        response = HttpResponse(
+            self.get_rendered_bodies()[self.content_encoding],
+            content_type=self.request.accepted_renderer.media_type)
+        if self.content_encoding is not None:
+            response['Content-Encoding'] = self.content_encoding
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_precompressed():
+            return super().list(request, *args, **kwargs)
+        self.content_encoding = self.get_content_encoding()
+        response = self.get_conditional_response(
+            None, self.get_precompressed_response)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
@@ -5,9 +5,11 @@ from django.conf import settings
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
 from django.db import models
+from django.db.models import Exists, OuterRef, Value
 from foodgram_backend.constants import (INGREDIENT_MAX_LENGTH,
                                         MAX_INGREDIENT_AMOUNT,
                                         MEASUREMENT_UNIT_MAX_LENGTH,
+                                        MEDIA_FILE_NAME_MAX_LENGTH,
                                         MIN_INGREDIENT_AMOUNT,
                                         RECIPE_MAX_LENGTH, TAG_MAX_LENGTH)
 
@@ -37,6 +39,7 @@ class Ingredient(models.Model):
     name = models.CharField('Название', max_length=INGREDIENT_MAX_LENGTH)
     measurement_unit = models.CharField(
         'Единица измерения', max_length=MEASUREMENT_UNIT_MAX_LENGTH)
+    modified = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -52,6 +55,23 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        """
+        Аннотирует рецепты флагами `is_favorited` и `is_in_shopping_cart`
+        для пользователя одним запросом вместо запроса на каждый рецепт.
+        """
+        if user is None or user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False))
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -61,6 +81,8 @@ class Recipe(models.Model):
     )
     name = models.CharField('Название', max_length=RECIPE_MAX_LENGTH)
     image = models.ImageField('Изображение', upload_to='recipes/images/')
+    image_variants = models.JSONField(
+        'Варианты изображения', default=dict, blank=True, editable=False)
     text = models.TextField('Описание')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -72,11 +94,24 @@ class Recipe(models.Model):
         Tag, related_name='recipes', verbose_name='Теги')
     cooking_time = models.IntegerField('Время приготовления (мин)')
     created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном (раз)', default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок (раз)', default=0, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created',)
+        indexes = [
+            models.Index(fields=['-created', '-id'],
+                         name='recipe_created_id_idx'),
+            models.Index(fields=['author', '-created', '-id'],
+                         name='recipe_author_created_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -129,6 +164,10 @@ class Favorite(models.Model):
                 fields=['user', 'recipe'], name='unique_user_recipe_favorite')
         ]
         ordering = ('-added',)
+        indexes = [
+            models.Index(fields=['user', '-added'],
+                         name='favorite_user_added_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} — {self.recipe}'
@@ -151,11 +190,41 @@ class ShoppingCart(models.Model):
                 name='unique_user_recipe_shopping_cart')
         ]
         ordering = ('-added',)
+        indexes = [
+            models.Index(fields=['user', '-added'],
+                         name='cart_user_added_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} — {self.recipe}'
 
 
+class ShoppingListItem(models.Model):
+    """
+    Итоговое количество ингредиента в списке покупок пользователя.
+    Поддерживается при изменении списка покупок и рецептов в нём.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='shopping_list_items')
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE,
+        related_name='shopping_list_items')
+    total_amount = models.IntegerField('Общее количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient_shopping_list')
+        ]
+
+    def __str__(self):
+        return f'{self.user} — {self.ingredient}: {self.total_amount}'
+
+
 class ShortLink(models.Model):
     recipe = models.OneToOneField(
         Recipe, on_delete=models.CASCADE, related_name='short_link')
@@ -169,3 +238,93 @@ class ShortLink(models.Model):
     class Meta:
         verbose_name = 'Короткая ссылка'
         verbose_name_plural = 'Короткие ссылки'
+
+
+class MediaFile(models.Model):
+    """
+    Число ссылок на загруженный файл из изображений рецептов и аватаров
+    (вместе с их вариантами). Файл удаляется, когда ссылок не остаётся.
+    """
+    name = models.CharField(
+        'Путь', max_length=MEDIA_FILE_NAME_MAX_LENGTH, unique=True)
+    references = models.IntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return f'{self.name} ({self.references})'
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя. Заполняется при публикации
+    рецепта и при подписке на автора (см. recipes.feed).
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='feed_entries')
+    recipe = models.ForeignKey(
+        Recipe, on_delete=models.CASCADE, related_name='feed_entries')
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='+')
+    created = models.DateTimeField('Дата публикации рецепта')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_user_feed_recipe')
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created', '-recipe'],
+                         name='feed_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} — {self.recipe}'
+
+
+class FeedPullAuthor(models.Model):
+    """
+    Автор с большим числом рецептов: его рецепты не копируются в ленты
+    подписчиков, а читаются при запросе ленты.
+    """
+    author = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='feed_pull')
+
+    class Meta:
+        verbose_name = 'Автор без копирования в ленты'
+        verbose_name_plural = 'Авторы без копирования в ленты'
+
+    def __str__(self):
+        return str(self.author)
+
+
+class RecipePopularity(models.Model):
+    """
+    Популярность рецепта с затуханием по времени. Пересчитывается
+    периодически командой `compute_popularity`; хранятся только рецепты
+    с активностью за последнее окно.
+    """
+    recipe = models.OneToOneField(
+        Recipe, on_delete=models.CASCADE, primary_key=True,
+        related_name='popularity')
+    score = models.FloatField('Популярность')
+    # Одинаково у всех строк: таблица заменяется целиком при пересчёте.
+    computed = models.DateTimeField('Время пересчёта')
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = [
+            models.Index(fields=['-score', '-recipe'],
+                         name='popularity_score_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe}: {self.score:.2f}'
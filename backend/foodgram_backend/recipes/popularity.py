@@ -0,0 +1,75 @@
+"""
+Популярность рецептов с затуханием по времени.
+
+Каждое добавление в избранное или в список покупок за последние
+`window_days` дней даёт рецепту вклад `вес * 2 ** (-возраст / период
+полураспада)`. Оценки считаются пакетно по потоку пар (рецепт, время),
+а не группировкой при каждом запросе, и сохраняются в
+`RecipePopularity`, по индексу которой отдаётся `?ordering=popular`.
+Время пересчёта хранится в строках таблицы и входит в ETag списка.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from foodgram_backend.constants import (BATCH_SIZE, POPULARITY_FAVORITE_WEIGHT,
+                                        POPULARITY_HALF_LIFE_HOURS,
+                                        POPULARITY_SHOPPING_CART_WEIGHT,
+                                        POPULARITY_WINDOW_DAYS)
+
+from .models import Favorite, RecipePopularity, ShoppingCart
+
+SOURCES = (
+    (Favorite, POPULARITY_FAVORITE_WEIGHT),
+    (ShoppingCart, POPULARITY_SHOPPING_CART_WEIGHT),
+)
+CHUNK_SIZE = BATCH_SIZE * 10
+
+
+def compute_scores(now, window_days=POPULARITY_WINDOW_DAYS,
+                   half_life_hours=POPULARITY_HALF_LIFE_HOURS):
+    """{id рецепта: оценка} по событиям за окно, заканчивающееся `now`."""
+    since = now - timedelta(days=window_days)
+    now = now.timestamp()
+    rate = math.log(2) / (half_life_hours * 3600)
+    exp = math.exp
+    scores = defaultdict(float)
+    for model, weight in SOURCES:
+        rows = model.objects.filter(added__gte=since).order_by().values_list(
+            'recipe_id', 'added').iterator(chunk_size=CHUNK_SIZE)
+        for chunk in iter(lambda: list(islice(rows, CHUNK_SIZE)), []):
+            recipe_ids, added = zip(*chunk)
+            decays = [
+                weight * exp(rate * (moment.timestamp() - now))
+                for moment in added]
+            for recipe_id, decay in zip(recipe_ids, decays):
+                scores[recipe_id] += decay
+    return scores
+
+
+def recompute(now=None, **options):
+    """
+    Пересчитывает таблицу популярности целиком в одной транзакции
+    и возвращает число рецептов в ней.
+    """
+    now = now or timezone.now()
+    scores = compute_scores(now, **options)
+    with transaction.atomic():
+        RecipePopularity.objects.all().delete()
+        RecipePopularity.objects.bulk_create(
+            (RecipePopularity(recipe_id=recipe_id, score=score, computed=now)
+             for recipe_id, score in scores.items()),
+            batch_size=BATCH_SIZE)
+    return len(scores)
+
+
+def get_computed():
+    """
+    Время последнего пересчёта из таблицы (None, если она пуста).
+    Читается из БД, поэтому видно всем процессам сразу после фиксации.
+    """
+    return RecipePopularity.objects.values_list(
+        'computed', flat=True).first()
@@ -1,11 +1,22 @@
-import base64
-
-from django.core.files.base import ContentFile
-from foodgram_backend.constants import (MAX_INGREDIENT_AMOUNT,
-                                        MIN_INGREDIENT_AMOUNT)
+import json
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.db.models.manager import BaseManager
+from django.http import QueryDict
+from foodgram_backend.constants import (AVATAR_VARIANTS, MAX_INGREDIENT_AMOUNT,
+                                        MIN_INGREDIENT_AMOUNT,
+                                        RECIPE_IMAGE_VARIANTS)
+from foodgram_backend.fields import Base64ImageField
+from foodgram_backend.images import (build_absolute_variant_urls,
+                                     get_variant_urls)
 from rest_framework import serializers
 from users.serializers import UserSerializer
+from users.utils import get_followed_author_ids
 
+from . import shopping_list
+from .cache import get_recipe_fragments
 from .models import Ingredient, IngredientInRecipe, Recipe, Tag
 
 
@@ -37,11 +48,12 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 
 class RecipeShortSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
-        read_only_fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+        read_only_fields = fields
 
     def get_image(self, obj):
         if obj.image:
@@ -49,8 +61,28 @@ class RecipeShortSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
+    def get_image_variants(self, obj):
+        return build_absolute_variant_urls(
+            get_variant_urls(obj.image, obj.image_variants,
+                             RECIPE_IMAGE_VARIANTS),
+            self.context['request'].build_absolute_uri)
+
+
+class RecipeFragmentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, BaseManager) else data)
+        # Счётчики автора берутся из объекта, а не из кешируемого фрагмента.
+        prefetch_related_objects(recipes, 'author')
+        fragments = get_recipe_fragments(recipes, self.child.build_fragments)
+        return [self.child.apply_user_overlay(recipe, fragments[recipe.id])
+                for recipe in recipes]
+
 
 class RecipeListSerializer(serializers.ModelSerializer):
+    """
+    Рецепт на полях DRF. Эталон для `RecipeFragmentSerializer`, который
+    отдаёт тот же JSON в API.
+    """
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(
@@ -58,23 +90,29 @@ class RecipeListSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'favorites_count', 'in_carts_count',
+            'name', 'image', 'image_variants', 'text', 'cooking_time'
         )
         read_only_fields = fields
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         if user.is_anonymous:
             return False
         return obj.favorited_by.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -86,14 +124,131 @@ class RecipeListSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.image.url)
         return None
 
+    def get_image_variants(self, obj):
+        return build_absolute_variant_urls(
+            get_variant_urls(obj.image, obj.image_variants,
+                             RECIPE_IMAGE_VARIANTS),
+            self.context['request'].build_absolute_uri)
+
+
+class RecipeFragmentSerializer(RecipeListSerializer):
+    """
+    Быстрый путь чтения рецептов с тем же JSON, что у
+    `RecipeListSerializer`. Не зависящая от пользователя часть рецепта
+    (фрагмент) собирается из словарей и кешируется, поверх неё
+    накладываются `is_favorited`, `is_in_shopping_cart`,
+    `author.is_subscribed`, счётчики и абсолютные ссылки на изображения.
+    """
+
+    class Meta(RecipeListSerializer.Meta):
+        list_serializer_class = RecipeFragmentListSerializer
+
+    def build_fragments(self, recipes):
+        """
+        Собирает фрагменты рецептов из `.values()`-выборок обычными
+        словарями, минуя поля DRF: два запроса на любое число рецептов.
+        """
+        prefetch_related_objects(recipes, 'author')
+        recipe_ids = [recipe.id for recipe in recipes]
+        tags = defaultdict(list)
+        for recipe_id, tag_id, name, slug in (
+                Recipe.tags.through.objects.filter(
+                    recipe_id__in=recipe_ids).order_by(
+                    'tag__name').values_list(
+                    'recipe_id', 'tag_id', 'tag__name', 'tag__slug')):
+            tags[recipe_id].append({'id': tag_id, 'name': name, 'slug': slug})
+        ingredients = defaultdict(list)
+        for recipe_id, ingredient_id, name, unit, amount in (
+                IngredientInRecipe.objects.filter(
+                    recipe_id__in=recipe_ids).order_by('pk').values_list(
+                    'recipe_id', 'ingredient_id', 'ingredient__name',
+                    'ingredient__measurement_unit', 'amount')):
+            ingredients[recipe_id].append({
+                'id': ingredient_id,
+                'name': name,
+                'measurement_unit': unit,
+                'amount': amount,
+            })
+        fragments = {}
+        for recipe in recipes:
+            author = recipe.author
+            fragments[recipe.id] = {
+                'id': recipe.id,
+                'tags': tags[recipe.id],
+                'author': {
+                    'email': author.email,
+                    'id': author.id,
+                    'username': author.username,
+                    'first_name': author.first_name,
+                    'last_name': author.last_name,
+                    'avatar': author.avatar.url if author.avatar else None,
+                    'avatar_variants': get_variant_urls(
+                        author.avatar, author.avatar_variants,
+                        AVATAR_VARIANTS),
+                },
+                'ingredients': ingredients[recipe.id],
+                'name': recipe.name,
+                'image': recipe.image.url if recipe.image else None,
+                'image_variants': get_variant_urls(
+                    recipe.image, recipe.image_variants,
+                    RECIPE_IMAGE_VARIANTS),
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+            }
+        return fragments
+
+    def build_absolute_url(self, url):
+        """
+        То же, что `request.build_absolute_uri(url)`, но схема и хост
+        вычисляются один раз на сериализатор, а не для каждой ссылки.
+        """
+        if not url:
+            return None
+        if not url.startswith('/') or url.startswith('//'):
+            return self.context['request'].build_absolute_uri(url)
+        if not hasattr(self, '_base_url'):
+            self._base_url = self.context['request'].build_absolute_uri(
+                '/')[:-1]
+        return self._base_url + url
+
+    def apply_user_overlay(self, recipe, fragment):
+        request = self.context['request']
+        followed_ids = get_followed_author_ids(request)
+        author = fragment['author']
+        # Счётчики меняются чаще фрагмента и берутся из объектов.
+        counters = recipe.author
+        return {
+            'id': fragment['id'],
+            'tags': fragment['tags'],
+            'author': {
+                'email': author['email'],
+                'id': author['id'],
+                'username': author['username'],
+                'first_name': author['first_name'],
+                'last_name': author['last_name'],
+                'is_subscribed': author['id'] in followed_ids,
+                'avatar': self.build_absolute_url(author['avatar']),
+                'avatar_variants': build_absolute_variant_urls(
+                    author['avatar_variants'], self.build_absolute_url),
+                'recipes_count': counters.recipes_count,
+                'followers_count': counters.followers_count,
+            },
+            'ingredients': fragment['ingredients'],
+            'is_favorited': self.get_is_favorited(recipe),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(recipe),
+            'favorites_count': recipe.favorites_count,
+            'in_carts_count': recipe.in_carts_count,
+            'name': fragment['name'],
+            'image': self.build_absolute_url(fragment['image']),
+            'image_variants': build_absolute_variant_urls(
+                fragment['image_variants'], self.build_absolute_url),
+            'text': fragment['text'],
+            'cooking_time': fragment['cooking_time'],
+        }
 
-class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=f'temp.{ext}')
-        return super().to_internal_value(data)
+    def to_representation(self, instance):
+        fragments = get_recipe_fragments([instance], self.build_fragments)
+        return self.apply_user_overlay(instance, fragments[instance.id])
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -110,6 +265,30 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         fields = ('ingredients', 'tags', 'image',
                   'name', 'text', 'cooking_time')
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.parse_form_data(data)
+        return super().to_internal_value(data)
+
+    def parse_form_data(self, data):
+        """
+        multipart/form-data: изображение передаётся файлом, `ingredients`
+        и `tags` — JSON-строками (теги можно передать и несколькими
+        полями `tags`).
+        """
+        parsed = data.dict()
+        for field in ('ingredients', 'tags'):
+            values = data.getlist(field)
+            if len(values) != 1:
+                if values:
+                    parsed[field] = values
+                continue
+            try:
+                parsed[field] = json.loads(values[0])
+            except ValueError:
+                parsed[field] = values
+        return parsed
+
     def validate_ingredients(self, value):
         if value is None:
             raise serializers.ValidationError(
@@ -181,19 +360,54 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                 'Время приготовления должно быть не меньше 1 минуты.')
         return value
 
-    def create_ingredients(self, recipe, ingredients_data):
+    def create_ingredients(self, recipe, amounts):
         IngredientInRecipe.objects.bulk_create([
             IngredientInRecipe(
-                recipe=recipe, ingredient_id=item['id'], amount=item['amount'])
-            for item in ingredients_data
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in amounts.items()
         ])
 
+    def set_ingredients(self, recipe, ingredients_data):
+        """
+        Приводит состав рецепта к `ingredients_data`: удаляет, изменяет
+        и добавляет только отличающиеся строки. Возвращает прежний
+        состав {id ингредиента: количество}.
+        """
+        amounts = {item['id']: item['amount'] for item in ingredients_data}
+        rows = {
+            row.ingredient_id: row
+            for row in recipe.recipe_ingredients.only(
+                'id', 'recipe_id', 'ingredient_id', 'amount')}
+        old_amounts = {
+            ingredient_id: row.amount for ingredient_id, row in rows.items()}
+        removed = [
+            row.pk for ingredient_id, row in rows.items()
+            if ingredient_id not in amounts]
+        if removed:
+            IngredientInRecipe.objects.filter(pk__in=removed).delete()
+        changed = []
+        for ingredient_id, row in rows.items():
+            amount = amounts.get(ingredient_id, row.amount)
+            if amount != row.amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        added = {
+            ingredient_id: amount for ingredient_id, amount in amounts.items()
+            if ingredient_id not in rows}
+        if added:
+            self.create_ingredients(recipe, added)
+        return old_amounts
+
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
-        self.create_ingredients(recipe, ingredients_data)
-        recipe.tags.set(tags_data)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(**validated_data)
+            self.create_ingredients(recipe, {
+                item['id']: item['amount'] for item in ingredients_data})
+            recipe.tags.add(*tags_data)
         return recipe
 
     def update(self, instance, validated_data):
@@ -206,19 +420,23 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
 
-        instance = super().update(instance, validated_data)
-
-        if ingredients_data is not None:
-            instance.recipe_ingredients.all().delete()
-            self.create_ingredients(instance, ingredients_data)
-
-        if tags_data is not None:
-            instance.tags.set(tags_data)
-
+        # Фрагмент рецепта сбрасывается после фиксации по сигналу
+        # сохранения рецепта: `bulk_*` для состава сигналов не отправляют.
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if ingredients_data is not None:
+                old_amounts = self.set_ingredients(instance, ingredients_data)
+                shopping_list.update_recipe(
+                    instance.id, old_amounts,
+                    {item['id']: item['amount'] for item in ingredients_data})
+            if tags_data is not None:
+                # `set` сравнивает с текущими тегами и меняет только разницу.
+                instance.tags.set(tags_data)
         return instance
 
     def to_representation(self, instance):
-        return RecipeListSerializer(instance, context=self.context).data
+        return RecipeFragmentSerializer(
+            instance, context=self.context).data
 
 
 class RecipeGetShortLinkSerializer(serializers.Serializer):
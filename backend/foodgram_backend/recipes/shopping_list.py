@@ -0,0 +1,125 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from foodgram_backend.cache_versions import (SHOPPING_LISTS, bump_version,
+                                             user_shopping_list)
+from foodgram_backend.constants import BATCH_SIZE
+
+from .models import IngredientInRecipe, ShoppingCart, ShoppingListItem
+
+
+def get_recipe_amounts(recipe_id):
+    """Возвращает {id ингредиента: количество} для рецепта."""
+    return dict(IngredientInRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def apply_deltas(user_ids, deltas):
+    """
+    Атомарно прибавляет `deltas` ({id ингредиента: изменение}) к спискам
+    покупок пользователей и удаляет позиции, количество в которых стало
+    нулевым.
+    """
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    items = ShoppingListItem.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            [ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                              total_amount=0)
+             for user_id in user_ids for ingredient_id in deltas],
+            batch_size=BATCH_SIZE, ignore_conflicts=True)
+        items.update(total_amount=F('total_amount') + Case(
+            *[When(ingredient_id=ingredient_id, then=Value(delta))
+              for ingredient_id, delta in deltas.items()],
+            default=Value(0)))
+        items.filter(total_amount__lte=0).delete()
+        transaction.on_commit(lambda: bump_version(
+            *[user_shopping_list(user_id) for user_id in user_ids]))
+
+
+def add_recipe(user_id, recipe_id):
+    apply_deltas([user_id], get_recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    apply_deltas([user_id], {
+        ingredient_id: -amount
+        for ingredient_id, amount in get_recipe_amounts(recipe_id).items()})
+
+
+def update_recipe(recipe_id, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки покупок с ним."""
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    apply_deltas(
+        ShoppingCart.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True),
+        deltas)
+
+
+def calculate_totals(user_ids=None):
+    """
+    Считает списки покупок заново по рецептам в корзинах. Возвращает
+    итератор по (id пользователя, id ингредиента, количество).
+    """
+    if user_ids is None:
+        rows = IngredientInRecipe.objects.filter(
+            recipe__in_shopping_cart__isnull=False)
+    else:
+        rows = IngredientInRecipe.objects.filter(
+            recipe__in_shopping_cart__user_id__in=user_ids)
+    return rows.values_list(
+        'recipe__in_shopping_cart__user_id', 'ingredient_id'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by().iterator(chunk_size=BATCH_SIZE)
+
+
+def rebuild(user_ids=None):
+    """Пересобирает списки покупок всех или указанных пользователей."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    created = 0
+    with transaction.atomic():
+        items.delete()
+        batch = []
+        for user_id, ingredient_id, total in calculate_totals(user_ids):
+            batch.append(ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id,
+                total_amount=total))
+            if len(batch) >= BATCH_SIZE:
+                created += len(ShoppingListItem.objects.bulk_create(batch))
+                batch = []
+        created += len(ShoppingListItem.objects.bulk_create(batch))
+        transaction.on_commit(lambda: bump_version(SHOPPING_LISTS))
+    return created
+
+
+def find_inconsistencies(user_ids=None):
+    """
+    Сравнивает сохранённые списки покупок с пересчитанными. Возвращает
+    список (id пользователя, id ингредиента, ожидается, сохранено).
+    """
+    expected = {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in calculate_totals(user_ids)}
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    stored = {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in items.values_list(
+            'user_id', 'ingredient_id', 'total_amount').iterator(
+            chunk_size=BATCH_SIZE)}
+    return [
+        (*key, expected.get(key), stored.get(key))
+        for key in sorted(expected.keys() | stored.keys())
+        if expected.get(key) != stored.get(key)]
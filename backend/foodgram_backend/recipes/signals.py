@@ -0,0 +1,227 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from foodgram_backend.cache_versions import (INGREDIENTS, RECIPE_FRAGMENTS,
+                                             RECIPES, TAGS, bump_version,
+                                             user_state)
+from foodgram_backend.constants import AVATAR_VARIANTS, RECIPE_IMAGE_VARIANTS
+from foodgram_backend.images import schedule_variants
+from users.models import Follow
+
+from . import counters, feed, shopping_list
+from .cache import invalidate_recipe_fragments
+from .media import change_references, get_file_names
+from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                     ShoppingCart, Tag)
+
+User = get_user_model()
+
+# Поля с загруженными файлами: (поле изображения, поле его вариантов).
+MEDIA_FIELDS = {
+    Recipe: ('image', 'image_variants'),
+    User: ('avatar', 'avatar_variants'),
+}
+# Поля пользователя, которые входят во фрагменты его рецептов.
+AUTHOR_FRAGMENT_FIELDS = (
+    'email', 'username', 'first_name', 'last_name', 'avatar',
+    'avatar_variants')
+VARIANT_SIZES = {
+    Recipe: RECIPE_IMAGE_VARIANTS,
+    User: AVATAR_VARIANTS,
+}
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def recipes_changed(sender, **kwargs):
+    bump_version(RECIPES)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version(TAGS)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    # Версия меняется после фиксации транзакции: иначе индекс ингредиентов
+    # может быть построен под новой версией по ещё старым данным.
+    transaction.on_commit(lambda: bump_version(INGREDIENTS))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def user_recipes_changed(sender, instance, **kwargs):
+    bump_version(user_state(instance.user_id))
+
+
+# Фрагменты сбрасываются после фиксации транзакции: иначе параллельный
+# запрос может закешировать фрагмент по ещё старым данным на весь
+# RECIPE_FRAGMENT_CACHE_TIMEOUT.
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_fragment_changed(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(invalidate_recipe_fragments, [instance.pk]))
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    transaction.on_commit(
+        partial(invalidate_recipe_fragments, [instance.recipe_id]))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        transaction.on_commit(
+            partial(invalidate_recipe_fragments, [instance.pk]))
+    elif pk_set:
+        transaction.on_commit(
+            partial(invalidate_recipe_fragments, list(pk_set)))
+    else:
+        transaction.on_commit(partial(bump_version, RECIPE_FRAGMENTS))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, RECIPE_FRAGMENTS))
+
+
+def invalidate_author_fragments(author_id):
+    invalidate_recipe_fragments(
+        Recipe.objects.filter(author_id=author_id).values_list(
+            'id', flat=True))
+
+
+@receiver(pre_save, sender=User)
+def author_saving(sender, instance, update_fields=None, **kwargs):
+    """Отмечает сохранение, меняющее данные автора во фрагментах."""
+    fields = AUTHOR_FRAGMENT_FIELDS
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    if instance._state.adding or not fields:
+        return
+    old = sender._default_manager.filter(
+        pk=instance.pk).values(*fields).first()
+    if old is None:
+        return
+    for name in fields:
+        field = sender._meta.get_field(name)
+        if field.get_prep_value(field.value_from_object(instance)) != old[
+                name]:
+            instance._author_changed = True
+            return
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, **kwargs):
+    if instance.__dict__.pop('_author_changed', False):
+        transaction.on_commit(
+            partial(invalidate_author_fragments, instance.pk))
+
+
+def get_media_files(instance):
+    field_name, variants_field = MEDIA_FIELDS[type(instance)]
+    return get_file_names(
+        getattr(instance, field_name).name,
+        getattr(instance, variants_field))
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=User)
+def media_saving(sender, instance, update_fields=None, **kwargs):
+    fields = MEDIA_FIELDS[sender]
+    if update_fields is not None and not set(fields) & set(update_fields):
+        return
+    old = None
+    if not instance._state.adding:
+        old = sender._default_manager.filter(
+            pk=instance.pk).values_list(*fields).first()
+    instance._media_files = get_file_names(*old) if old else set()
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def media_saved(sender, instance, **kwargs):
+    old = instance.__dict__.pop('_media_files', None)
+    if old is None:
+        return
+    new = get_media_files(instance)
+    change_references(
+        {**dict.fromkeys(new - old, 1), **dict.fromkeys(old - new, -1)})
+    # Ссылки на варианты учитываются при их сохранении, поэтому
+    # построение ставится в очередь после учёта ссылок.
+    schedule_variants(
+        instance, *MEDIA_FIELDS[sender], VARIANT_SIZES[sender])
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def media_deleted(sender, instance, **kwargs):
+    change_references(dict.fromkeys(get_media_files(instance), -1))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(
+            feed.fan_out, instance.pk, instance.author_id, instance.created))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    feed.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Follow)
+def counted_object_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Follow)
+def counted_object_deleted(sender, instance, **kwargs):
+    counters.change(instance, -1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_removed(sender, instance, **kwargs):
+    shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
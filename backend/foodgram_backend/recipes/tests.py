@@ -0,0 +1,258 @@
+import io
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import override_settings
+from foodgram_backend.constants import RECIPE_IMAGE_VARIANTS
+from foodgram_backend.images import VARIANTS_FORMAT
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from users.models import Follow
+
+from .benchmarks import BENCHMARKS
+from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                     ShoppingCart, Tag)
+from .serializers import RecipeFragmentSerializer, RecipeListSerializer
+
+User = get_user_model()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RecipeAPITestCase(APITestCase):
+    """Общие данные: авторы с рецептами, избранное, корзина, подписки."""
+    recipes_per_author = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = [
+            User.objects.create_user(
+                email=f'user{index}@example.com', username=f'user{index}',
+                first_name='Имя', last_name='Фамилия', password='password')
+            for index in range(4)]
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', slug=f'tag{index}')
+            for index in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {index}', measurement_unit='г')
+            for index in range(5)]
+        cls.recipes = []
+        for author in cls.authors:
+            for index in range(cls.recipes_per_author):
+                recipe = Recipe.objects.create(
+                    author=author, name=f'Рецепт {index}',
+                    image='recipes/images/test.png', text='Описание',
+                    cooking_time=10)
+                recipe.tags.set(cls.tags[index % 3:index % 3 + 2])
+                IngredientInRecipe.objects.bulk_create(
+                    IngredientInRecipe(
+                        recipe=recipe, ingredient=ingredient, amount=10)
+                    for ingredient in cls.ingredients[:1 + index % 5])
+                cls.recipes.append(recipe)
+        for recipe in cls.recipes[::2]:
+            Favorite.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[::3]:
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def warm_up(self, path, params):
+        """
+        Прогревает версии кеша и число объектов для запроса `params`,
+        чтобы число запросов не зависело от того, как СУБД его считает.
+        Фрагменты рецептов страницы при этом остаются непрогретыми.
+        """
+        cache.clear()
+        self.client.get(path, {**params, 'limit': 1, 'page': 1000})
+
+
+class ListQueriesTest(RecipeAPITestCase):
+    """Число запросов страницы списка не зависит от её размера."""
+
+    def test_recipe_list(self):
+        for limit in (5, 30):
+            with self.subTest(limit=limit):
+                params = {'limit': limit}
+                self.warm_up('/api/recipes/', params)
+                # Рецепты с флагами, теги, ингредиенты, подписки.
+                with self.assertNumQueries(4):
+                    response = self.client.get('/api/recipes/', params)
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_subscriptions(self):
+        for limit, recipes_limit in ((1, 1), (3, 10)):
+            with self.subTest(limit=limit, recipes_limit=recipes_limit):
+                params = {'limit': limit, 'recipes_limit': recipes_limit}
+                self.warm_up('/api/users/subscriptions/', params)
+                # Авторы, их рецепты одним оконным запросом, подписки.
+                with self.assertNumQueries(3):
+                    response = self.client.get(
+                        '/api/users/subscriptions/', params)
+                results = response.json()['results']
+                self.assertEqual(len(results), limit)
+                for author in results:
+                    self.assertEqual(len(author['recipes']), recipes_limit)
+
+
+class RecipeFragmentSerializerParityTest(RecipeAPITestCase):
+    """`RecipeFragmentSerializer` даёт тот же JSON, что и поля DRF."""
+
+    def test_matches_field_serializers(self):
+        author = self.authors[0]
+        author.avatar = 'users/avatars/test.png'
+        author.save(update_fields=['avatar'])
+        recipe = self.recipes[0]
+        recipe.image_variants = {
+            'format': VARIANTS_FORMAT,
+            'source': recipe.image.name,
+            'sizes': {
+                label: {
+                    'width': size,
+                    'url': f'recipes/images/variants/test_{label}.png',
+                    'webp': f'recipes/images/variants/test_{label}.webp',
+                }
+                for label, size in RECIPE_IMAGE_VARIANTS.items()
+            },
+        }
+        recipe.save(update_fields=['image_variants'])
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = self.user
+        renderer = JSONRenderer()
+        # Первый проход строит фрагменты, второй читает их из кеша.
+        for attempt in ('cold', 'warm'):
+            with self.subTest(cache=attempt):
+                recipes = list(Recipe.objects.select_related(
+                    'author').with_user_flags(self.user))
+                context = {'request': request}
+                expected = RecipeListSerializer(
+                    recipes, many=True, context=context).data
+                self.assertEqual(
+                    renderer.render(RecipeFragmentSerializer(
+                        recipes, many=True, context=context).data),
+                    renderer.render(expected))
+                self.assertEqual(
+                    renderer.render(RecipeFragmentSerializer(
+                        recipes[0], context=context).data),
+                    renderer.render(expected[0]))
+
+
+class RecipeFilterTest(RecipeAPITestCase):
+    """Рецепт с несколькими запрошенными тегами попадает в выдачу один раз."""
+
+    def get_all_pages(self, params):
+        ids = []
+        response = self.client.get('/api/recipes/', {**params, 'limit': 7})
+        count = response.json()['count']
+        while True:
+            data = response.json()
+            ids += [recipe['id'] for recipe in data['results']]
+            if not data['next']:
+                return ids, count
+            response = self.client.get(data['next'])
+
+    def test_multiple_tags(self):
+        slugs = [self.tags[0].slug, self.tags[1].slug]
+        for params, recipes in (
+                ({'tags': slugs}, Recipe.objects.all()),
+                ({'tags': slugs, 'is_favorited': 1},
+                 Recipe.objects.filter(favorited_by__user=self.user))):
+            with self.subTest(params=params):
+                expected = set(recipes.filter(
+                    tags__slug__in=slugs).values_list('id', flat=True))
+                ids, count = self.get_all_pages(params)
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(set(ids), expected)
+                self.assertEqual(count, len(expected))
+
+
+class RecipeUpdateTest(RecipeAPITestCase):
+    """Изменение одного количества не пересоздаёт строки состава."""
+
+    def test_single_amount_change(self):
+        recipe = self.recipes[4]
+        rows = list(recipe.recipe_ingredients.order_by('id'))
+        data = {
+            'ingredients': [
+                {'id': row.ingredient_id, 'amount': row.amount}
+                for row in rows],
+            'tags': list(recipe.tags.values_list('id', flat=True)),
+        }
+        data['ingredients'][0]['amount'] += 5
+        self.client.force_authenticate(recipe.author)
+        # Рецепт; проверка ингредиентов и тегов; в транзакции: прежние
+        # файлы изображения, рецепт, состав, одна строка обновляется,
+        # списки покупок, теги (без изменений); ответ: теги, состав,
+        # подписки. Удалений и вставок строк состава нет.
+        with self.assertNumQueries(14):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        updated = list(recipe.recipe_ingredients.order_by('id'))
+        self.assertEqual(
+            [row.pk for row in updated], [row.pk for row in rows])
+        self.assertEqual(
+            [row.amount for row in updated],
+            [item['amount'] for item in data['ingredients']])
+
+
+class BenchmarkCommandTest(RecipeAPITestCase):
+    """Все сценарии `benchmark` выполняются с хостами из настроек."""
+
+    def test_all_scenarios(self):
+        allowed_hosts = [
+            host for host in settings.ALLOWED_HOSTS if host != 'testserver']
+        output = io.StringIO()
+        with self.settings(ALLOWED_HOSTS=allowed_hosts):
+            call_command('benchmark', size=5, repeat=1, stdout=output)
+        for name in BENCHMARKS:
+            self.assertIn(name, output.getvalue())
+
+
+class IngredientSearchTest(RecipeAPITestCase):
+    """Поиск по названию с прогретым индексом не обращается к БД."""
+
+    def test_warm_search_queries(self):
+        self.client.get('/api/ingredients/', {'name': 'инг'})
+        for name in ('инг', 'ингредиент 1', 'ингридиент'):
+            with self.subTest(name=name), self.assertNumQueries(0):
+                response = self.client.get('/api/ingredients/', {'name': name})
+            self.assertTrue(response.json())
+
+
+class RecipeListValidatorTest(RecipeAPITestCase):
+    """ETag списка меняется вместе со счётчиками рецептов страницы."""
+
+    def test_counters_on_page(self):
+        params = {'limit': 5}
+        self.warm_up('/api/recipes/', params)
+        etag = self.client.get('/api/recipes/', params)['ETag']
+        # Только рецепты страницы, без фрагментов, тегов и подписок.
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/recipes/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        page_ids = [
+            recipe['id'] for recipe in self.client.get(
+                '/api/recipes/', params).json()['results']]
+        other = self.authors[1]
+        Favorite.objects.create(
+            user=other, recipe=Recipe.objects.exclude(
+                id__in=page_ids).first())
+        self.assertEqual(
+            self.client.get('/api/recipes/', params)['ETag'], etag)
+
+        Favorite.objects.create(user=other, recipe_id=page_ids[0])
+        response = self.client.get(
+            '/api/recipes/', params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['results'][0]['favorites_count'],
+            Recipe.objects.get(id=page_ids[0]).favorites_count)
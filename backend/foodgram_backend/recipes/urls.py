@@ -12,6 +12,8 @@ router.register(r'tags', views.TagViewSet, basename='tag')
 urlpatterns = [
     path('recipes/', views.RecipeViewSet.as_view(
         {'get': 'list', 'post': 'create'}), name='recipe-list'),
+    path('recipes/feed/', views.RecipeFeedView.as_view(),
+         name='recipe-feed'),
     path('recipes/<int:pk>/', views.RecipeViewSet.as_view({
         'get': 'retrieve',
         'patch': 'partial_update',
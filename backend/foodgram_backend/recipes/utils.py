@@ -1,25 +1,105 @@
-def generate_shopping_list(recipes):
-    """
-    Генерирует текстовый список покупок на основе списка рецептов.
-    Агрегирует ингредиенты по названию и единице измерения.
-    """
-    ingredients = {}
+import csv
+import io
+import json
+
+from django.conf import settings
 
-    for recipe in recipes:
-        for item in recipe.recipe_ingredients.select_related(
-                'ingredient').all():
-            ing = item.ingredient
-            amount = item.amount
-            key = (ing.name, ing.measurement_unit)
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+except ImportError:
+    canvas = None
 
-            if key in ingredients:
-                ingredients[key] += amount
-            else:
-                ingredients[key] = amount
+SHOPPING_LIST_CHUNK_LINES = 100
+PDF_FONT_NAME = 'ShoppingListFont'
 
+
+def generate_shopping_list(ingredients):
+    """
+    Генерирует текстовый список покупок по частям для потоковой отдачи.
+    Принимает уже агрегированные строки (название, единица измерения,
+    количество).
+    """
     lines = ['Список покупок\n', '==============\n\n']
 
-    for (name, unit), total in ingredients.items():
+    for name, unit, total in ingredients:
         lines.append(f'{name} — {total} {unit}\n')
+        if len(lines) >= SHOPPING_LIST_CHUNK_LINES:
+            yield ''.join(lines)
+            lines = []
+
+    yield ''.join(lines)
+
+
+def generate_shopping_list_csv(ingredients):
+    """Список покупок в CSV: название, количество, единица измерения."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('Название', 'Количество', 'Единица измерения'))
+
+    for number, (name, unit, total) in enumerate(ingredients, start=1):
+        writer.writerow((name, total, unit))
+        if number % SHOPPING_LIST_CHUNK_LINES == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def generate_shopping_list_json(ingredients):
+    """Список покупок в JSON: массив объектов, отдаётся по частям."""
+    items = []
+    separator = '['
+
+    for name, unit, total in ingredients:
+        items.append(separator + json.dumps(
+            {'name': name, 'measurement_unit': unit, 'amount': total},
+            ensure_ascii=False, separators=(',', ':')))
+        separator = ','
+        if len(items) >= SHOPPING_LIST_CHUNK_LINES:
+            yield ''.join(items)
+            items = []
+
+    yield ''.join(items) + ('[]' if separator == '[' else ']')
+
+
+def generate_shopping_list_pdf(ingredients):
+    """
+    Список покупок в PDF. Требует reportlab и TTF-шрифт с кириллицей
+    (настройка SHOPPING_LIST_PDF_FONT).
+    """
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT))
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+
+    pdf.setFont(PDF_FONT_NAME, 16)
+    pdf.drawString(margin, height - margin, 'Список покупок')
+    pdf.setFont(PDF_FONT_NAME, 12)
+    y = height - margin - 2 * line_height
+    for name, unit, total in ingredients:
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont(PDF_FONT_NAME, 12)
+            y = height - margin
+        pdf.drawString(margin, y, f'{name} — {total} {unit}')
+        y -= line_height
+    pdf.save()
+
+    yield buffer.getvalue()
+
 
-    return ''.join(lines)
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain', generate_shopping_list),
+    'csv': ('text/csv; charset=utf-8', generate_shopping_list_csv),
+    'json': ('application/json', generate_shopping_list_json),
+}
+if canvas is not None:
+    SHOPPING_LIST_FORMATS['pdf'] = (
+        'application/pdf', generate_shopping_list_pdf)
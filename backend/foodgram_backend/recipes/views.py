@@ -1,5 +1,13 @@
-from django.http import HttpResponse, HttpResponseNotFound
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.http import (HttpResponse, HttpResponseNotFound,
+                         StreamingHttpResponse)
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.functional import cached_property
+from foodgram_backend.cache_versions import (AUTHORS, INGREDIENTS,
+                                             RECIPE_FRAGMENTS, RECIPES, TAGS,
+                                             user_state)
 from foodgram_backend.pagination import CustomPagination
 from rest_framework import generics, status, viewsets
 from rest_framework.decorators import action
@@ -7,26 +15,109 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from . import feed, ingredient_index, ingredient_search, popularity
+from .cache import cache_streamed_content, get_shopping_list_file_key
 from .filters import RecipeFilter
-from .models import Favorite, Ingredient, Recipe, ShoppingCart, ShortLink, Tag
-from .serializers import (IngredientSerializer, RecipeGetShortLinkSerializer,
-                          RecipeListSerializer, RecipeShortSerializer,
+from .mixins import ConditionalGetMixin, PrecompressedListMixin
+from .models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                     ShoppingListItem, ShortLink, Tag)
+from .serializers import (IngredientSerializer, RecipeFragmentSerializer,
+                          RecipeGetShortLinkSerializer, RecipeShortSerializer,
                           RecipeWriteSerializer, TagSerializer)
-from .utils import generate_shopping_list
+from .utils import SHOPPING_LIST_FORMATS
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.prefetch_related(
-        'tags', 'recipe_ingredients__ingredient', 'author'
-    ).all()
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.select_related('author').all()
     filterset_class = RecipeFilter
     pagination_class = CustomPagination
     ordering = ('-created',)
+    validator_versions = (RECIPE_FRAGMENTS, AUTHORS)
+    vary_on_user = True
+    page = None
+
+    @property
+    def is_popular(self):
+        """Список по популярности (`?ordering=popular`)."""
+        return (self.action == 'list' and self.request.query_params.get(
+            'ordering') == 'popular')
+
+    @property
+    def cursor_fields(self):
+        if self.is_popular:
+            return ('popularity_score', 'id')
+        return ('created', 'id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset().with_user_flags(self.request.user)
+        if self.is_popular:
+            # Только рецепты с оценкой: выборка идёт по индексу таблицы
+            # популярности, а не по всем рецептам.
+            queryset = queryset.filter(
+                popularity__isnull=False
+            ).annotate(
+                popularity_score=F('popularity__score')
+            ).order_by('-popularity_score', '-id')
+        return queryset
+
+    def get_validator_versions(self, instance=None):
+        versions = super().get_validator_versions(instance)
+        if instance is None:
+            versions.append(RECIPES)
+        return versions
+
+    @cached_property
+    def popularity_computed(self):
+        return popularity.get_computed()
+
+    @staticmethod
+    def get_counters(recipe):
+        """Счётчики рецепта и автора: они меняются, не меняя `modified`."""
+        author = recipe.author
+        return [
+            recipe.pk, recipe.favorites_count, recipe.in_carts_count,
+            author.recipes_count, author.followers_count]
+
+    def get_validator_state(self):
+        state = self.get_count_state()
+        if self.page is not None:
+            state.append([self.get_counters(recipe) for recipe in self.page])
+        return state
+
+    def get_object_validators(self, instance):
+        return self.get_counters(instance), instance.modified
+
+    def get_count_state(self):
+        """Популярность пересчитывает команда в другом процессе."""
+        if self.is_popular:
+            return [self.popularity_computed]
+        return []
+
+    def list(self, request, *args, **kwargs):
+        """
+        Страница выбирается до проверки ETag: в него входят счётчики её
+        рецептов, поэтому 304 отдаётся, только пока они не изменились.
+        Фрагменты, теги и подписки при этом не читаются.
+        """
+        self.page = self.paginate_queryset(
+            self.filter_queryset(self.get_queryset()))
+        return self.get_conditional_response(
+            None, lambda: self.get_paginated_response(
+                self.get_serializer(self.page, many=True).data))
+
+    def get_count_versions(self):
+        versions = [RECIPES]
+        user = self.request.user
+        if user.is_authenticated and any(
+                param in self.request.query_params
+                for param in ('is_favorited', 'is_in_shopping_cart')):
+            versions.append(user_state(user.id))
+        return versions
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeWriteSerializer
-        return RecipeListSerializer
+        return RecipeFragmentSerializer
 
     def get_permissions(self):
         if self.action in ('create', 'update', 'partial_update', 'destroy'):
@@ -95,7 +186,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 {'errors': 'Рецепт уже в списке покупок.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        ShoppingCart.objects.create(user=request.user, recipe=recipe)
+        with transaction.atomic():
+            ShoppingCart.objects.create(user=request.user, recipe=recipe)
         serializer = RecipeShortSerializer(
             recipe, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -112,7 +204,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 {'errors': 'Рецепта нет в списке покупок.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        cart_item.delete()
+        with transaction.atomic():
+            cart_item.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['get'], permission_classes=[AllowAny])
@@ -124,6 +217,27 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+class RecipeFeedView(generics.GenericAPIView):
+    """
+    Лента рецептов авторов из подписок пользователя, новые сначала.
+    Страницы выбираются только по курсору (keyset-пагинация).
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = CustomPagination
+    cursor_fields = ('created', 'recipe_id')
+
+    def get(self, request):
+        entries = self.paginator.paginate_sources(
+            feed.get_sources(request.user), request, self)
+        recipes = Recipe.objects.select_related('author').with_user_flags(
+            request.user).in_bulk([entry.recipe_id for entry in entries])
+        serializer = RecipeFragmentSerializer(
+            [recipes[entry.recipe_id] for entry in entries
+             if entry.recipe_id in recipes],
+            many=True, context=self.get_serializer_context())
+        return self.paginator.get_paginated_response(serializer.data)
+
+
 def redirect_to_recipe(request, short_code):
     try:
         short_link = ShortLink.objects.select_related('recipe').get(
@@ -136,31 +250,66 @@ def redirect_to_recipe(request, short_code):
 class DownloadShoppingCartView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
 
+    def perform_content_negotiation(self, request, force=False):
+        # Параметр `format` выбирает формат файла, а не рендерер DRF.
+        return super().perform_content_negotiation(request, force=True)
+
     def get(self, request):
         user = request.user
-        recipes = Recipe.objects.filter(
-            in_shopping_cart__user=user
-        ).prefetch_related('recipe_ingredients__ingredient')
-
-        if not recipes.exists():
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
             return Response(
-                {'detail': 'Ваш список покупок пуст.'},
+                {'format': [f'Поддерживаемые форматы: '
+                            f'{", ".join(SHOPPING_LIST_FORMATS)}.']},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        content_type, generate = SHOPPING_LIST_FORMATS[file_format]
 
-        shopping_list = generate_shopping_list(recipes)
+        key = get_shopping_list_file_key(user.id, file_format)
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            if not ShoppingCart.objects.filter(user=user).exists():
+                return Response(
+                    {'detail': 'Ваш список покупок пуст.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            ingredients = ShoppingListItem.objects.filter(
+                user=user
+            ).values_list(
+                'ingredient__name', 'ingredient__measurement_unit',
+                'total_amount'
+            ).order_by('ingredient__name', 'ingredient__measurement_unit')
+            response = StreamingHttpResponse(
+                cache_streamed_content(
+                    key, generate(ingredients.iterator())),
+                content_type=content_type)
 
-        filename = 'shopping_cart.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        filename = f'shopping_cart.{file_format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(PrecompressedListMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    validator_versions = (INGREDIENTS,)
+
+    def get_validator_state(self):
+        """
+        Каталог могут изменить другие процессы, например импорт. Поиск
+        по названию отвечает из индекса и берёт его состояние, чтобы
+        не обращаться к БД на каждый запрос.
+        """
+        if self.action == 'list' and self.request.query_params.get('name'):
+            state = ingredient_index.get_state()
+            if state is not None:
+                return [state]
+        return [ingredient_index.get_catalog_state()]
 
     def get_queryset(self):
         """Фильтрация по частичному совпадению name"""
@@ -170,9 +319,28 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(name__istartswith=name)
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск по названию отвечает из индексов в памяти: сначала
+        совпадения по началу названия, затем похожие названия.
+        """
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return self.get_conditional_response(
+            None, lambda: self.search(name, request, *args, **kwargs))
+
+    def search(self, name, request, *args, **kwargs):
+        results = ingredient_search.search(name)
+        if results is None:
+            return super(ConditionalGetMixin, self).list(
+                request, *args, **kwargs)
+        return Response(results)
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(PrecompressedListMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    validator_versions = (TAGS,)
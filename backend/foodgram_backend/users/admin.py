@@ -9,7 +9,9 @@ User = get_user_model()
 
 
 class UserAdmin(BaseUserAdmin):
-    list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff')
+    list_display = ('username', 'email', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count', 'is_staff')
+    readonly_fields = ('recipes_count', 'followers_count')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     fieldsets = (
         (None, {'fields': ('username', 'password')}),
@@ -20,6 +22,7 @@ class UserAdmin(BaseUserAdmin):
                        'groups', 'user_permissions'),
         }),
         (_('Important dates'), {'fields': ('last_login', 'date_joined')}),
+        ('Счётчики', {'fields': ('recipes_count', 'followers_count')}),
     )
     add_fieldsets = (
         (None, {
@@ -25,6 +25,12 @@ class User(AbstractUser):
         blank=False,
         null=False)
     avatar = models.ImageField(upload_to='users/', blank=True, null=True)
+    avatar_variants = models.JSONField(
+        'Варианты аватара', default=dict, blank=True, editable=False)
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -1,11 +1,11 @@
-import base64
-import uuid
-
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from foodgram_backend.constants import AVATAR_VARIANTS
+from foodgram_backend.fields import Base64ImageField
+from foodgram_backend.images import (build_absolute_variant_urls,
+                                     get_variant_urls)
 from rest_framework import serializers
 
-from .models import Follow
+from .utils import get_followed_author_ids, get_recipes_limit
 
 User = get_user_model()
 
@@ -13,6 +13,7 @@ User = get_user_model()
 class UserSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
     avatar = serializers.SerializerMethodField()
+    avatar_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = User
@@ -24,15 +25,16 @@ class UserSerializer(serializers.ModelSerializer):
             'last_name',
             'is_subscribed',
             'avatar',
+            'avatar_variants',
+            'recipes_count',
+            'followers_count',
         )
         read_only_fields = ('email', 'id', 'username', 'first_name',
-                            'last_name')
+                            'last_name', 'recipes_count', 'followers_count')
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
-        if request is None or request.user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=request.user, author=obj).exists()
+        return obj.id in get_followed_author_ids(request)
 
     def get_avatar(self, obj):
         if obj.avatar and hasattr(self, 'context') and self.context.get(
@@ -41,6 +43,15 @@ class UserSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.avatar.url)
         return None
 
+    def get_avatar_variants(self, obj):
+        request = self.context.get('request')
+        if request is None:
+            return None
+        return build_absolute_variant_urls(
+            get_variant_urls(obj.avatar, obj.avatar_variants,
+                             AVATAR_VARIANTS),
+            request.build_absolute_uri)
+
 
 class UserCreateSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True)
@@ -69,31 +80,15 @@ class UserCreateSerializer(serializers.ModelSerializer):
 
 
 class SetAvatarSerializer(serializers.Serializer):
-    avatar = serializers.CharField(write_only=True)
+    avatar = Base64ImageField(write_only=True)
     avatar_url = serializers.SerializerMethodField(read_only=True)
 
-    def validate_avatar(self, value):
-        if not value.startswith('data:image'):
-            raise serializers.ValidationError(
-                'Некорректный формат изображения.')
-        return value
-
     def save(self, **kwargs):
         user = self.context['request'].user
-        avatar_data = self.validated_data['avatar']
-
-        if user.avatar:
-            user.avatar.delete(save=False)
-
-        format, imgstr = avatar_data.split(';base64,')
-        ext = format.split('/')[-1]
-        filename = f'{uuid.uuid4()}.{ext}'
-
-        user.avatar.save(
-            filename,
-            ContentFile(base64.b64decode(imgstr)),
-            save=True
-        )
+        avatar = self.validated_data['avatar']
+        # Прежний файл удаляется при сохранении, если на него больше
+        # нет ссылок (см. recipes.media).
+        user.avatar.save(avatar.name, avatar, save=True)
         return user
 
     def get_avatar_url(self, obj):
@@ -105,29 +100,18 @@ class SetAvatarSerializer(serializers.Serializer):
 
 class UserWithRecipesSerializer(UserSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = UserSerializer.Meta.fields + ('recipes', 'recipes_count')
+        fields = UserSerializer.Meta.fields + ('recipes',)
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        if request is None:
-            return []
-
-        recipes_limit = request.query_params.get('recipes_limit')
-        try:
-            limit = int(recipes_limit) if recipes_limit else None
-        except (TypeError, ValueError):
-            limit = None
-
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:limit]
+        recipes = getattr(obj, 'shown_recipes', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+            limit = get_recipes_limit(self.context.get('request'))
+            if limit:
+                recipes = recipes[:limit]
         from recipes.serializers import RecipeShortSerializer
         return RecipeShortSerializer(recipes, many=True,
                                      context=self.context).data
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
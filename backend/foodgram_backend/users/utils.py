@@ -0,0 +1,48 @@
+from django.db.models import Prefetch
+
+from .models import Follow
+
+
+def get_followed_author_ids(request):
+    """
+    Возвращает множество id авторов, на которых подписан пользователь.
+    Загружается одним запросом и кешируется на объекте запроса, чтобы
+    все сериализаторы в рамках одного запроса использовали общий результат.
+    """
+    if request is None or request.user.is_anonymous:
+        return frozenset()
+    followed_ids = getattr(request, '_followed_author_ids', None)
+    if followed_ids is None:
+        followed_ids = frozenset(Follow.objects.filter(
+            user=request.user).values_list('author_id', flat=True))
+        request._followed_author_ids = followed_ids
+    return followed_ids
+
+
+def get_recipes_limit(request):
+    """Значение параметра `recipes_limit` или None, если он не задан."""
+    if request is None:
+        return None
+    try:
+        limit = int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError):
+        return None
+    return limit if limit > 0 else None
+
+
+def with_recipes(queryset, recipes_limit=None):
+    """
+    Подгружает в `shown_recipes` не больше `recipes_limit` последних
+    рецептов каждого автора. Ограничение применяется в БД через
+    ROW_NUMBER() по автору, поэтому страница подписок загружается
+    фиксированным числом запросов и в память попадают только
+    показываемые рецепты.
+    """
+    from recipes.models import Recipe
+    recipes = Recipe.objects.only(
+        'id', 'author_id', 'name', 'image', 'image_variants', 'cooking_time'
+    ).order_by('-created', '-id')
+    if recipes_limit:
+        recipes = recipes[:recipes_limit]
+    return queryset.prefetch_related(
+        Prefetch('recipes', queryset=recipes, to_attr='shown_recipes'))
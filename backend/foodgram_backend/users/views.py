@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet as DjoserUserViewSet
+from foodgram_backend.cache_versions import user_state
 from foodgram_backend.pagination import CustomPagination
 from rest_framework import status
 from rest_framework.generics import ListAPIView
@@ -10,6 +12,7 @@ from rest_framework.views import APIView
 
 from .models import Follow
 from .serializers import SetAvatarSerializer, UserWithRecipesSerializer
+from .utils import get_recipes_limit, with_recipes
 
 User = get_user_model()
 
@@ -40,7 +43,9 @@ class UserAvatarView(APIView):
     def delete(self, request):
         user = request.user
         if user.avatar:
-            user.avatar.delete(save=True)
+            user.avatar = None
+            user.avatar_variants = {}
+            user.save(update_fields=['avatar', 'avatar_variants'])
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -48,10 +53,18 @@ class UserSubscriptionsView(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserWithRecipesSerializer
     pagination_class = CustomPagination
+    cursor_fields = ('subscribed', 'id')
 
     def get_queryset(self):
-        return User.objects.filter(
-            following__user=self.request.user).prefetch_related('recipes')
+        queryset = User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            subscribed=F('following__created')
+        )
+        return with_recipes(queryset, get_recipes_limit(self.request))
+
+    def get_count_versions(self):
+        return [user_state(self.request.user.id)]
 
 
 class UserSubscribeView(APIView):
@@ -74,6 +87,9 @@ class UserSubscribeView(APIView):
             )
 
         Follow.objects.create(user=user, author=author)
+        author = with_recipes(
+            User.objects.filter(pk=author.pk), get_recipes_limit(request)
+        ).get()
         serializer = UserWithRecipesSerializer(
             author, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)